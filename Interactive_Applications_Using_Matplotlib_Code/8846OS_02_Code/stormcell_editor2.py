@@ -1,10 +1,15 @@
 from __future__ import print_function
 from collections import OrderedDict
+import threading
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.io import netcdf_file
 from matplotlib.collections import PolyCollection
-from tutorial import storm_loader, storm_saver
+from tutorial import cached_storm_loader, storm_saver
 
 ncf = netcdf_file('KTLX_20100510_22Z.nc')
 data = ncf.variables['Reflectivity']
@@ -18,7 +23,7 @@ im = ax.imshow(data[i], origin='lower',
                vmin=0, vmax=80, cmap='gist_ncar')
 fig.colorbar(im)
 
-stormcells = storm_loader('polygons.shp')
+stormcells = cached_storm_loader('polygons.shp')
 polycolls = []
 stormmap = []
 for frame in range(np.max(stormcells['frame_index']) + 1):
@@ -101,6 +106,48 @@ class KeymapControl:
         for key, (description, _) in self._keymap.items():
             print("%11s %s" % (key, description))
 
+class SaveWorker(object):
+    """
+    Run save jobs one at a time, in order, on background threads and
+    report the outcome on the GUI thread as a 'saved' or 'save_failed'
+    event through the canvas callback registry.
+    """
+    def __init__(self, canvas, interval=100):
+        self.canvas = canvas
+        self._thread = None
+        self._pending = 0
+        self._results = Queue()
+        # Poll for finished jobs from the GUI thread.
+        self._timer = canvas.new_timer(interval=interval)
+        self._timer.add_callback(self._report)
+
+    def submit(self, description, job):
+        previous = self._thread
+        def run():
+            if previous is not None:
+                previous.join()
+            try:
+                job()
+            except Exception as err:
+                self._results.put(('save_failed', (description, err)))
+            else:
+                self._results.put(('saved', description))
+        self._thread = threading.Thread(target=run)
+        self._thread.start()
+        self._pending += 1
+        self._timer.start()
+
+    def _report(self):
+        while True:
+            try:
+                event, eventdata = self._results.get_nowait()
+            except Empty:
+                break
+            self._pending -= 1
+            self.canvas.callbacks.process(event, eventdata)
+        if not self._pending:
+            self._timer.stop()
+
 class ControlSys(KeymapControl, PickControl):
     def __init__(self, fig, im, data, polygons, stormdata, stormmap):
         self.fig = fig
@@ -111,6 +158,7 @@ class ControlSys(KeymapControl, PickControl):
         self.polygons = polygons
         self.stormdata = stormdata
         self.stormmap = stormmap
+        self.save_worker = SaveWorker(fig.canvas)
         self._hidekey = None
         self._hidecid = None
         KeymapControl.__init__(self, fig)
@@ -125,6 +173,9 @@ class ControlSys(KeymapControl, PickControl):
         self._connect('delete', self.delete_stormcell)
         self._connect('save', lambda x: self.save_stormdata('polygons_new.shp'))
         self._connect('help', lambda x: self.display_help_menu())
+        self._connect('saved', lambda fname: print("Saved %s" % fname))
+        self._connect('save_failed',
+                      lambda failure: print("Saving %s failed: %s" % failure))
 
         self.add_key_action('left', 'Back a frame',
                             lambda : self.change_frame(-1))
@@ -176,7 +227,10 @@ class ControlSys(KeymapControl, PickControl):
             indexes[indexes > stormcell_index] -= 1
 
     def save_stormdata(self, fname):
-        storm_saver(fname, self.stormdata)
+        # The file writing happens on a worker thread against a snapshot,
+        # so editing can go on while the save is in flight.
+        snapshot = self.stormdata.copy()
+        self.save_worker.submit(fname, lambda: storm_saver(fname, snapshot))
 
     # --- Viewer methods ---
     def change_frame(self, frame_delta):
@@ -2,23 +2,41 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.collections import LineCollection
 from matplotlib.animation import FuncAnimation
+from matplotlib.colors import colorConverter
+from matplotlib.path import Path
 from tutorial import storm_loader
 
 class Tracks(object):
     def __init__(self, ax, tails=None):
         self.tracks = None
         self.tails = tails
+        self._stormdata = None
+        self._trackmap = None
+        self._trackframes = None
         self.initialize_lines(ax)
 
     @staticmethod
     def create_trackmap(stormdata):
-        trackmap = []
-        for trackid in range(np.max(stormdata['track_id']) + 1):
-            indexes = np.where(stormdata['track_id'] == trackid)[0]
-            # Makes sure the track segments are in chronological order
-            indexes = indexes[np.argsort(stormdata['frame_index'][indexes])]
-            trackmap.append(indexes)
-        return trackmap
+        # One sort by track, then by frame, makes sure the track segments
+        # are in chronological order; each track is then a slice of it.
+        order = np.lexsort((stormdata['frame_index'], stormdata['track_id']))
+        trackids = stormdata['track_id'][order]
+        bounds = np.searchsorted(trackids,
+                                 np.arange(np.max(stormdata['track_id']) + 2))
+        return [order[start:stop] for start, stop in zip(bounds[:-1],
+                                                         bounds[1:])]
+
+    def get_trackmap(self, stormdata):
+        """
+        Return the trackmap of *stormdata*, made only when a different
+        storm data array comes in.
+        """
+        if stormdata is not self._stormdata:
+            self._trackmap = self.create_trackmap(stormdata)
+            self._trackframes = [stormdata['frame_index'][indexes]
+                                 for indexes in self._trackmap]
+            self._stormdata = stormdata
+        return self._trackmap
 
     def remove_lines(self):
         if self.tracks is not None:
@@ -32,14 +50,18 @@ class Tracks(object):
 
     def update_lines(self, frame_index, stormdata):
         segments = []
-        for indexes in self.create_trackmap(stormdata):
-            trackdata = stormdata[indexes]
-            trackdata = trackdata[trackdata['frame_index'] <= frame_index]
+        trackmap = self.get_trackmap(stormdata)
+        xcents, ycents = stormdata['xcent'], stormdata['ycent']
+        for indexes, frames in zip(trackmap, self._trackframes):
+            # The frames of a track are sorted, so its visible part is a
+            # slice of it.
+            stop = np.searchsorted(frames, frame_index, side='right')
+            start = 0
             if self.tails:
-                mask = trackdata['frame_index'] >= (frame_index - self.tails)
-                trackdata = trackdata[mask]
+                start = np.searchsorted(frames, frame_index - self.tails)
+            indexes = indexes[start:stop]
             # There must always be something in a track, even it it is NaNs.
-            segments.append(zip(trackdata['xcent'], trackdata['ycent'])
+            segments.append(zip(xcents[indexes], ycents[indexes])
                             or [(np.nan, np.nan)])
         self.tracks.set_segments(segments)
 
@@ -52,11 +74,109 @@ class Tracks(object):
             lws[indx] = lw
             self.tracks.set_linewidths(lws)
 
+class TrackTails(Tracks):
+    """
+    Track tails kept in a ring buffer. Each track has *tails* slots, one
+    per segment of its tail, and the segment ending at frame ``f`` goes
+    into slot ``f % tails``. Changing frames only rewrites the slots of
+    the tracks with cells entering or leaving the tail, whichever way
+    the frames go, and the collection itself is made only once.
+
+    If *fade* is True, older segments are drawn more transparently.
+
+    """
+    def __init__(self, ax, tails, fade=False):
+        self.fade = fade
+        self._frame_index = None
+        Tracks.__init__(self, ax, tails)
+
+    def get_trackmap(self, stormdata):
+        if stormdata is not self._stormdata:
+            trackmap = Tracks.get_trackmap(self, stormdata)
+            self._index_segments(stormdata, trackmap)
+        return self._trackmap
+
+    def _index_segments(self, stormdata, trackmap):
+        # Every pair of consecutive cells in a track is a segment.
+        order = (np.concatenate(trackmap) if trackmap else
+                 np.zeros(0, dtype=int))
+        tracknums = np.repeat(np.arange(len(trackmap)),
+                              [len(indexes) for indexes in trackmap])
+        paired = np.flatnonzero(tracknums[1:] == tracknums[:-1])
+        firsts, seconds = order[paired], order[paired + 1]
+        self._segtracks = tracknums[paired]
+        self._segverts = np.empty((len(paired), 2, 2))
+        self._segverts[:, :, 0] = np.column_stack(
+                [stormdata['xcent'][firsts], stormdata['xcent'][seconds]])
+        self._segverts[:, :, 1] = np.column_stack(
+                [stormdata['ycent'][firsts], stormdata['ycent'][seconds]])
+        self._segstarts = stormdata['frame_index'][firsts]
+        self._segends = stormdata['frame_index'][seconds]
+        # The segments by end frame and by start frame, to find the
+        # ones that come into view or go out of it.
+        self._byend = np.argsort(self._segends, kind='mergesort')
+        self._sortedends = self._segends[self._byend]
+        self._bystart = np.argsort(self._segstarts, kind='mergesort')
+        self._sortedstarts = self._segstarts[self._bystart]
+
+        # The ring of slots for all the tracks, slot after slot; each
+        # path of the collection is a view of one of its segments.
+        self._ring = np.empty((self.tails, len(trackmap), 2, 2))
+        self._ring.fill(np.nan)
+        paths = self.tracks.get_paths()
+        paths[:] = [Path(seg) for seg in self._ring.reshape(-1, 2, 2)]
+        color = colorConverter.to_rgba(self.tracks.get_color()[0])
+        self._colors = np.array([color] * len(paths))
+        self.tracks.set_color(self._colors)
+        self._frame_index = None
+
+    def _segments_between(self, sortedframes, byframe, lo, hi):
+        # The segments whose frame is in [lo, hi)
+        return byframe[np.searchsorted(sortedframes, lo):
+                       np.searchsorted(sortedframes, hi)]
+
+    def update_lines(self, frame_index, stormdata):
+        self.get_trackmap(stormdata)
+        old = self._frame_index
+        if old is None or abs(frame_index - old) >= self.tails:
+            # Too far to step, so fill the ring from scratch.
+            self._ring.fill(np.nan)
+            changed = self._segments_between(self._sortedends, self._byend,
+                                             frame_index - self.tails + 1,
+                                             frame_index + 1)
+        else:
+            lo, hi = sorted([old, frame_index])
+            # The segments ending or starting in the frames passed over
+            changed = np.concatenate([
+                self._segments_between(self._sortedends, self._byend,
+                                       lo + 1, hi + 1),
+                self._segments_between(self._sortedstarts, self._bystart,
+                                       lo - self.tails, hi - self.tails)])
+        visible = ((self._segstarts[changed] >= frame_index - self.tails) &
+                   (self._segends[changed] <= frame_index))
+        slots = self._segends[changed] % self.tails
+        tracknums = self._segtracks[changed]
+        # Clear the segments going out of view before filling in the ones
+        # coming into view, which may reuse their slots.
+        gone = ~visible
+        self._ring[slots[gone], tracknums[gone]] = np.nan
+        self._ring[slots[visible], tracknums[visible]] = \
+                self._segverts[changed[visible]]
+        self._frame_index = frame_index
+
+        if self.fade:
+            # The alpha of a slot goes by the age of the segment in it.
+            ages = (frame_index - np.arange(self.tails)) % self.tails
+            colors = self._colors.reshape(self.tails, -1, 4)
+            colors[:, :, 3] = (1.0 / (ages + 1))[:, np.newaxis]
+            self.tracks.set_color(self._colors)
+        self.tracks.stale = True
+
 
 if __name__ == '__main__':
     stormcells = storm_loader('polygons.shp')
     fig, ax = plt.subplots(1, 1)
-    trks = Tracks(ax, 3)
+    trks = TrackTails(ax, 3, fade=True)
     ax.set_xlim(stormcells['xcent'].min(), stormcells['xcent'].max())
     ax.set_ylim(stormcells['ycent'].min(), stormcells['ycent'].max())
     trkanim = FuncAnimation(fig, trks.update_lines,
@@ -18,22 +18,30 @@ class Tracks:
             self.tracks = LineCollection([])
             ax.add_collection(self.tracks)
 
-        self.trackmap = []
-        for trackid in range(np.max(stormcells['track_id']) + 1):
-            indexes = np.where(stormcells['track_id'] == trackid)[0]
-            # Makes sure the track segments are in chronological order
-            indexes = indexes[np.argsort(stormcells['frame_index'][indexes])]
-            self.trackmap.append(indexes)
+        # One sort by track, then by frame, makes sure the track segments
+        # are in chronological order; each track is then a slice of it.
+        order = np.lexsort((stormcells['frame_index'], stormcells['track_id']))
+        trackids = stormcells['track_id'][order]
+        bounds = np.searchsorted(trackids,
+                                 np.arange(np.max(stormcells['track_id']) + 2))
+        self.trackmap = [order[start:stop]
+                         for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.trackframes = [stormcells['frame_index'][indexes]
+                            for indexes in self.trackmap]
 
     def update_frame(self, frame_index, stormcells):
         segments = []
-        for trackid, indexes in enumerate(self.trackmap):
-            trackdata = stormcells[indexes]
-            trackdata = trackdata[trackdata['frame_index'] <= frame_index]
+        xcents, ycents = stormcells['xcent'], stormcells['ycent']
+        for indexes, frames in zip(self.trackmap, self.trackframes):
+            # The frames of a track are sorted, so its visible part is a
+            # slice of it.
+            stop = np.searchsorted(frames, frame_index, side='right')
+            start = 0
             if self.tails:
-                mask = trackdata['frame_index'] > (frame_index - self.tails)
-                trackdata = trackdata[mask]
-            segments.append(zip(trackdata['xcent'], trackdata['ycent'])
+                start = np.searchsorted(frames, frame_index - self.tails,
+                                        side='right')
+            indexes = indexes[start:stop]
+            segments.append(zip(xcents[indexes], ycents[indexes])
                             or [(np.nan, np.nan)])
         self.tracks.set_segments(segments)
 
@@ -1,6 +1,6 @@
 from mpl_toolkits.basemap import shapefile
 from collections import defaultdict
-from itertools import groupby, izip
+from itertools import izip
 import numpy as np
 
 storm_dtype = [('xcent', 'f'), ('ycent', 'f'), ('frame_index', 'i'),
@@ -52,19 +52,44 @@ def storm_saver(filename, storms):
         filename = filename[:-4]
     shp.save(filename)
 
+def group_indexes(values):
+    """
+    Group the positions of *values* by value, in one pass. Returns the
+    sorted unique values (the keys), an array of row indexes ordered by
+    group and the group boundaries within it. The rows holding
+    ``keys[i]`` are ``indexes[bounds[i]:bounds[i + 1]]``, and keep their
+    original order, so the input does not need to be sorted.
+
+    """
+    values = np.asarray(values)
+    indexes = np.argsort(values, kind='mergesort')
+    keys, starts = np.unique(values[indexes], return_index=True)
+    bounds = np.append(starts, len(values))
+    return keys, indexes, bounds
+
 def track_loader(filename, group='track_id'):
+    """
+    Return a dictionary of Nx2 arrays of the storm centroids, keyed by
+    the *group* column.
+    """
     storms = storm_loader(filename)
+    keys, indexes, bounds = group_indexes(storms[group])
+    points = np.column_stack([storms['xcent'], storms['ycent']])[indexes]
     tracks = defaultdict(list)
-    for key, items in groupby(storms, lambda x: x[group]):
-        for storm in items:
-            tracks[key].append((storm['xcent'], storm['ycent']))
+    for key, start, stop in zip(keys, bounds[:-1], bounds[1:]):
+        tracks[key] = points[start:stop]
     return tracks
 
 def polygon_loader(filename, group='frame_index'):
+    """
+    Return a dictionary of lists of polygon vertex arrays, keyed by the
+    *group* column.
+    """
     storms = storm_loader(filename)
+    keys, indexes, bounds = group_indexes(storms[group])
+    polys = storms['poly'][indexes]
     polygons = defaultdict(list)
-    for key, items in groupby(storms, lambda x: x[group]):
-        for storm in items:
-            polygons[key].append(storm['poly'])
+    for key, start, stop in zip(keys, bounds[:-1], bounds[1:]):
+        polygons[key] = list(polys[start:stop])
     return polygons
 
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+from weakref import WeakKeyDictionary
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.axes import Axes
@@ -7,35 +8,68 @@ import matplotlib.projections as mproj
 
 class DataAxes(Axes):
     name = 'data'
+    def __init__(self, *args, **kwargs):
+        # The data-to-index affine of each image, see _index_transform()
+        self._index_transforms = WeakKeyDictionary()
+        Axes.__init__(self, *args, **kwargs)
+
     def format_coord(self, x, y):
         normal_part = Axes.format_coord(self, x, y)
         if self.images:
             # Most recent image is usually on top
-            im = self.images[-1]
-            j, i = self._coords2index(im, x, y)
-            z = im.get_array()[j, i]
+            z = self.values_at(x, y)
             return "Value: %f, %s" % (z, normal_part)
         return normal_part
 
-    @staticmethod
-    def _coords2index(im, x, y):
+    def values_at(self, x, y, im=None):
         """
-        Convert data coordinates to index coordinates of the image array.
-        Credit: mpldatacursor developers. Copyright (c) 2012. BSD License
-        Modified from original found at:
-        https://github.com/joferkington/mpldatacursor/blob/master/mpldatacursor/pick_info.py
+        Return the values of the image *im* (by default, the most recent
+        one) at data coordinates *x*, *y*, which can be scalars or arrays
+        to probe many points at once.
+        """
+        if im is None:
+            im = self.images[-1]
+        j, i = self._coords2index(im, x, y)
+        return im.get_array()[j, i]
+
+    def _index_transform(self, im):
+        """
+        Return the scales and offsets taking data coordinates to index
+        coordinates of the image array, remade only when the extent,
+        origin or shape of the image changes.
         """
-        xmin, xmax, ymin, ymax = im.get_extent()
+        key = (tuple(im.get_extent()), im.origin, im.get_array().shape[:2])
+        cached = self._index_transforms.get(im)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        xmin, xmax, ymin, ymax = key[0]
         if im.origin == 'upper':
             ymin, ymax = ymax, ymin
-        im_shape = im.get_array().shape[:2]
         data_extent = mtransforms.Bbox([[ymin, xmin], [ymax, xmax]])
-        array_extent = mtransforms.Bbox([[0, 0], im_shape])
+        array_extent = mtransforms.Bbox([[0, 0], key[2]])
         trans = (mtransforms.BboxTransformFrom(data_extent) +
                  mtransforms.BboxTransformTo(array_extent))
-        j, i = trans.transform_point([y, x]).astype(int)
+        # The transform is a pure scale and translation, so its matrix
+        # reduces to one scale and one offset per axis.
+        matrix = trans.get_matrix()
+        coeffs = (matrix[0, 0], matrix[0, 2], matrix[1, 1], matrix[1, 2])
+        self._index_transforms[im] = (key, coeffs)
+        return coeffs
+
+    def _coords2index(self, im, x, y):
+        """
+        Convert data coordinates to index coordinates of the image array.
+        Credit: mpldatacursor developers. Copyright (c) 2012. BSD License
+        Modified from original found at:
+        https://github.com/joferkington/mpldatacursor/blob/master/mpldatacursor/pick_info.py
+        """
+        jscale, joffset, iscale, ioffset = self._index_transform(im)
+        im_shape = im.get_array().shape[:2]
+        j = (np.asarray(y) * jscale + joffset).astype(int)
+        i = (np.asarray(x) * iscale + ioffset).astype(int)
         # Clip the coordinates to the array bounds.
-        return min(max(j, 0), im_shape[0] - 1), min(max(i, 0), im_shape[1] - 1)
+        return (np.clip(j, 0, im_shape[0] - 1),
+                np.clip(i, 0, im_shape[1] - 1))
 
 # Register DataAxes so that it can be used like any other Axes
 # Registered using the 'name' attribute, so it will be accessible as 'data'.
@@ -1,11 +1,16 @@
 from __future__ import print_function
 from collections import OrderedDict
+import threading
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.io import netcdf_file
 from matplotlib.collections import PolyCollection, LineCollection
 from matplotlib import widgets
-from tutorial import storm_loader, storm_saver
+from tutorial import cached_storm_loader, storm_saver, points_in_polygon
 
 def calc_area(verts):
     """
@@ -302,6 +307,48 @@ def build_radio_buttons(fig, height):
         buttons.set_active = set_active
     return buttons
 
+class SaveWorker(object):
+    """
+    Run save jobs one at a time, in order, on background threads and
+    report the outcome on the GUI thread as a 'saved' or 'save_failed'
+    event through the canvas callback registry.
+    """
+    def __init__(self, canvas, interval=100):
+        self.canvas = canvas
+        self._thread = None
+        self._pending = 0
+        self._results = Queue()
+        # Poll for finished jobs from the GUI thread.
+        self._timer = canvas.new_timer(interval=interval)
+        self._timer.add_callback(self._report)
+
+    def submit(self, description, job):
+        previous = self._thread
+        def run():
+            if previous is not None:
+                previous.join()
+            try:
+                job()
+            except Exception as err:
+                self._results.put(('save_failed', (description, err)))
+            else:
+                self._results.put(('saved', description))
+        self._thread = threading.Thread(target=run)
+        self._thread.start()
+        self._pending += 1
+        self._timer.start()
+
+    def _report(self):
+        while True:
+            try:
+                event, eventdata = self._results.get_nowait()
+            except Empty:
+                break
+            self._pending -= 1
+            self.canvas.callbacks.process(event, eventdata)
+        if not self._pending:
+            self._timer.stop()
+
 class ControlSys(KeymapControl, PickControl, ButtonControl):
     def __init__(self, fig, raddisp, data, polygons, lines, stormdata):
         self.fig = fig
@@ -309,10 +356,12 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
         self.data = data
         self.i = 0
         self.selected = None
+        self.lasso_selected = []
         self.polygons = polygons
         self.lines = lines
         self.stormdata = stormdata
         self.stormmap = polygons.create_stormmap(stormdata)
+        self.save_worker = SaveWorker(fig.canvas)
         self._hidekey = None
         self._hidecid = None
         KeymapControl.__init__(self, fig)
@@ -337,7 +386,11 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
         self._connect('create', self.add_stormcell)
         self._connect('save', lambda x: self.save_stormdata('polygons_new.shp'))
         self._connect('help', lambda x: self.display_help_menu())
+        self._connect('saved', lambda fname: print("Saved %s" % fname))
+        self._connect('save_failed',
+                      lambda failure: print("Saving %s failed: %s" % failure))
         self._connect('button_press_event', self._start_stormcell)
+        self._connect('button_press_event', self._start_lasso_selection)
 
         self._mode_buttons.on_clicked(self.set_mode)
         self._toggle_buttons.on_clicked(self.toggle_visibility)
@@ -392,14 +445,19 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
 
     # --- Stormcell editing methods ---
     def delete_selected(self):
-        if self.selected is None:
-            return
+        selected = list(self.lasso_selected)
+        if self.selected is not None:
+            selected.append(self.selected)
         # We only want to delete when the selection is in the current frame
-        if self.i != self.selected[0]:
+        selected = [inds for inds in selected if inds[0] == self.i]
+        if not selected:
             return
 
-        self._emit('delete', self.selected)
+        # Deleting from the last cell back keeps the other cell indexes valid
+        for inds in sorted(set(selected), reverse=True):
+            self._emit('delete', inds)
         self.selected = None
+        self.lasso_selected = []
         self.fig.canvas.draw_idle()
 
     def delete_stormcell(self, inds):
@@ -424,7 +482,10 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
                                            stormcell_index)
 
     def save_stormdata(self, fname):
-        storm_saver(fname, self.stormdata)
+        # The file writing happens on a worker thread against a snapshot,
+        # so editing can go on while the save is in flight.
+        snapshot = self.stormdata.copy()
+        self.save_worker.submit(fname, lambda: storm_saver(fname, snapshot))
 
     def _start_stormcell(self, event):
         if self.fig.canvas.widgetlock.locked():
@@ -505,6 +566,7 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
         if event.artist not in self.polygons.polygons:
             return
         ind = event.ind[0]
+        self.clear_lasso_selection()
         self._emit('deselect', self.selected)
         if (self.i, ind) != self.selected:
             self.selected = (self.i, ind)
@@ -513,6 +575,41 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
             self.selected = None
         self.fig.canvas.draw_idle()
 
+    def clear_lasso_selection(self):
+        for inds in self.lasso_selected:
+            self._emit('deselect', inds)
+        self.lasso_selected = []
+
+    def _start_lasso_selection(self, event):
+        # A right-button drag in selection mode selects every stormcell
+        # whose centroid it encloses.
+        if self.fig.canvas.widgetlock.locked():
+            return
+        if event.inaxes is not self.raddisp.im.get_axes():
+            return
+        if self._mode != 'Selection' or event.button != 3:
+            return
+        self._lasso = widgets.Lasso(event.inaxes, (event.xdata, event.ydata),
+                                    self._finish_lasso_selection)
+        self.fig.canvas.widgetlock(self._lasso)
+
+    def _finish_lasso_selection(self, verts):
+        self._emit('deselect', self.selected)
+        self.selected = None
+        self.clear_lasso_selection()
+        if len(verts) > 2:
+            indexes = self.stormmap[self.i]
+            inside = points_in_polygon(self.stormdata['xcent'][indexes],
+                                       self.stormdata['ycent'][indexes],
+                                       verts)
+            self.lasso_selected = [(self.i, cell)
+                                   for cell in np.flatnonzero(inside)]
+            for inds in self.lasso_selected:
+                self._emit('select', inds)
+        self.fig.canvas.widgetlock.release(self._lasso)
+        self._lasso = None
+        self.fig.canvas.draw_idle()
+
 if __name__ == '__main__':
     from matplotlib.animation import FuncAnimation
 
@@ -520,7 +617,7 @@ if __name__ == '__main__':
     data = ncf.variables['Reflectivity']
     lats = ncf.variables['lat']
     lons = ncf.variables['lon']
-    stormcells = storm_loader('polygons.shp')
+    stormcells = cached_storm_loader('polygons.shp')
 
     fig, ax = plt.subplots(1, 1)
     raddisp = RadarDisplay(ax, lats, lons)
@@ -2,17 +2,17 @@ from __future__ import print_function
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import RectangleSelector
-from matplotlib.path import Path
-from itertools import product
 
 class DataContainer(object):
     def __init__(self, xs, ys):
-        self.xs = xs
-        self.ys = ys
+        self.xs = np.asarray(xs)
+        self.ys = np.asarray(ys)
 
     def select_from_bbox(self, x1, y1, x2, y2):
-        bbox = Path(list(product([x1, x2], [y1, y2])), closed=True)
-        return bbox.contains_points(zip(self.xs, self.ys))
+        xmin, xmax = min(x1, x2), max(x1, x2)
+        ymin, ymax = min(y1, y2), max(y1, y2)
+        return ((xmin <= self.xs) & (self.xs <= xmax) &
+                (ymin <= self.ys) & (self.ys <= ymax))
 
 if __name__ == '__main__':
     xs, ys = np.random.random((2, 25))
@@ -1,6 +1,7 @@
 from __future__ import print_function
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy.io import netcdf_file
 from matplotlib.widgets import RectangleSelector
 from mpl_toolkits.basemap import Basemap, pyproj
 
@@ -11,15 +12,114 @@ def distance(evnt_click, evnt_release):
     print("(%f, %f) to (%f, %f): %f km" %
             (evnt_click.xdata, evnt_click.ydata,
              evnt_release.xdata, evnt_release.ydata, dist / 1000.0))
+    return dist / 1000.0
+
+class CrossSection(object):
+    """
+    Sample a frames-first radar cube, on the grid *lats* by *lons*,
+    along a straight line, by bilinear interpolation between the four
+    pixels around each sample point. Samples off the grid come out as
+    NaN. The sample points, their pixels and their weights are kept
+    until the line changes.
+
+    """
+    def __init__(self, data, lats, lons):
+        self.data = data
+        self.lats = np.asarray(lats)
+        self.lons = np.asarray(lons)
+        self._line = None
+        self._pixels = None
+        self._weights = None
+        self._outside = None
+
+    def set_line(self, x0, y0, x1, y1):
+        line = (x0, y0, x1, y1)
+        if line == self._line:
+            return
+        # About one sample per pixel along the line
+        lonstep = abs(self.lons[-1] - self.lons[0]) / (len(self.lons) - 1)
+        latstep = abs(self.lats[-1] - self.lats[0]) / (len(self.lats) - 1)
+        count = int(max(abs(x1 - x0) / lonstep, abs(y1 - y0) / latstep)) + 1
+        xs = np.linspace(x0, x1, max(count, 2))
+        ys = np.linspace(y0, y1, max(count, 2))
+
+        # Fractional pixel positions of the samples, and the lower pixel
+        # of the pair around them along each axis.
+        fj = self._fractions(ys, self.lats)
+        fi = self._fractions(xs, self.lons)
+        self._outside = ((fj < 0) | (fj > len(self.lats) - 1) |
+                         (fi < 0) | (fi > len(self.lons) - 1))
+        # Samples off the grid still get (edge) pixels, to keep the
+        # gather simple, and are masked out afterwards.
+        fj = np.clip(fj, 0, len(self.lats) - 1)
+        fi = np.clip(fi, 0, len(self.lons) - 1)
+        j0 = np.minimum(fj.astype(int), len(self.lats) - 2)
+        i0 = np.minimum(fi.astype(int), len(self.lons) - 2)
+        wj, wi = fj - j0, fi - i0
+        # The four corners of each sample, as one gather of pixels
+        self._pixels = (np.concatenate([j0, j0, j0 + 1, j0 + 1]),
+                        np.concatenate([i0, i0 + 1, i0, i0 + 1]))
+        self._weights = np.vstack([(1 - wj) * (1 - wi), (1 - wj) * wi,
+                                   wj * (1 - wi), wj * wi])
+        self._line = line
+
+    @staticmethod
+    def _fractions(coords, axis):
+        return ((coords - axis[0]) / (axis[-1] - axis[0]) *
+                (len(axis) - 1))
+
+    def _interpolate(self, corners):
+        # *corners* has the 4 corner values of each sample along its
+        # last axis, one corner after the other.
+        corners = corners.reshape(corners.shape[:-1] + self._weights.shape)
+        values = (corners * self._weights).sum(axis=-2)
+        values[..., self._outside] = np.nan
+        return values
+
+    def along(self, frame_index):
+        """
+        Return the values sampled along the line in frame *frame_index*.
+        """
+        frame = np.asarray(self.data[frame_index])
+        return self._interpolate(frame[self._pixels])
+
+    def time_distance(self):
+        """
+        Return the values sampled along the line in every frame, as a
+        frames by samples array.
+        """
+        j, i = self._pixels
+        return self._interpolate(np.asarray(self.data[:, j, i]))
 
 if __name__ == '__main__':
-    fig, ax = plt.subplots(1, 1)
+    ncf = netcdf_file('KTLX_20100510_22Z.nc')
+    data = ncf.variables['Reflectivity']
+    lats = ncf.variables['lat']
+    lons = ncf.variables['lon']
+
+    fig, (ax, xsect_ax) = plt.subplots(2, 1)
     bm = Basemap(projection='cyl', resolution='l',
                  llcrnrlon=-130, llcrnrlat=25,
                  urcrnrlon=-60, urcrnrlat=55)
     bm.drawstates(ax=ax)
     bm.drawcountries(ax=ax)
     bm.drawcoastlines(ax=ax)
-    rs = RectangleSelector(ax, distance, drawtype='line',
+    ax.imshow(data[0], origin='lower', vmin=0.1, vmax=80, cmap='gist_ncar',
+              extent=(lons[0], lons[-1], lats[0], lats[-1]))
+    xsect = CrossSection(data, lats[:], lons[:])
+
+    def cross_section(evnt_click, evnt_release):
+        dist = distance(evnt_click, evnt_release)
+        xsect.set_line(evnt_click.xdata, evnt_click.ydata,
+                       evnt_release.xdata, evnt_release.ydata)
+        xsect_ax.cla()
+        xsect_ax.imshow(xsect.time_distance(), origin='lower', aspect='auto',
+                        vmin=0.1, vmax=80, cmap='gist_ncar',
+                        extent=(0, dist, 0, data.shape[0] - 1))
+        xsect_ax.set_xlabel("Distance (km)")
+        xsect_ax.set_ylabel("Frame")
+        fig.canvas.draw_idle()
+
+    rs = RectangleSelector(ax, cross_section, drawtype='line',
                            minspanx=0.001, minspany=0.001)
     plt.show()
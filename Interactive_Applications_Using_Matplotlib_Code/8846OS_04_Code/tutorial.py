@@ -1,6 +1,7 @@
 from mpl_toolkits.basemap import shapefile
+import os
 from collections import defaultdict
-from itertools import groupby, izip
+from itertools import izip
 import numpy as np
 
 storm_dtype = [('xcent', 'f'), ('ycent', 'f'), ('frame_index', 'i'),
@@ -52,19 +53,205 @@ def storm_saver(filename, storms):
         filename = filename[:-4]
     shp.save(filename)
 
+# The cache sidecar has the same layout as the one written by the
+# chapter 5 tutorial, so either copy can read the other's cache.
+_cache_magic = b'STRMCCH1'
+_cache_header_dtype = [('magic', 'S8'),
+                       ('shp_mtime', 'f8'), ('shp_size', 'i8'),
+                       ('dbf_mtime', 'f8'), ('dbf_size', 'i8'),
+                       ('nrows', 'i8'), ('nverts', 'i8')]
+
+# Same as storm_dtype, minus the object column holding the polygons.
+column_dtype = [col for col in storm_dtype if col[0] != 'poly']
+
+def _cache_sources(filename):
+    base = filename[:-4] if filename.endswith('.shp') else filename
+    return base + '.shp', base + '.dbf', base + '.stormcache'
+
+def _cache_stamp(shpname, dbfname):
+    shp_stat = os.stat(shpname)
+    dbf_stat = os.stat(dbfname)
+    return (shp_stat.st_mtime, shp_stat.st_size,
+            dbf_stat.st_mtime, dbf_stat.st_size)
+
+def _cache_layout(nrows, nverts):
+    """
+    Byte offsets of the columns, offsets and vertex blocks in a cache
+    file, each rounded up to an 8-byte boundary.
+    """
+    align = lambda n: (n + 7) // 8 * 8
+    colstart = align(np.dtype(_cache_header_dtype).itemsize)
+    offstart = align(colstart + nrows * np.dtype(column_dtype).itemsize)
+    vertstart = align(offstart + (nrows + 1) * 8)
+    return colstart, offstart, vertstart, vertstart + nverts * 16
+
+def read_storm_cache(filename):
+    """
+    Memory-map the cache sidecar of the shapefile *filename* and return
+    it as a `storm_dtype` structured array, or None if there is no cache
+    or the shapefile has changed (by mtime or size) since it was written.
+    The 'poly' entries are views into the mapped vertex block.
+    """
+    shpname, dbfname, cachename = _cache_sources(filename)
+    try:
+        stamp = _cache_stamp(shpname, dbfname)
+        header = np.fromfile(cachename, dtype=_cache_header_dtype, count=1)
+    except (IOError, OSError):
+        return None
+    if len(header) != 1 or header['magic'][0] != _cache_magic:
+        return None
+    header = header[0]
+    if (header['shp_mtime'], header['shp_size'],
+        header['dbf_mtime'], header['dbf_size']) != stamp:
+        return None
+
+    nrows, nverts = int(header['nrows']), int(header['nverts'])
+    colstart, offstart, vertstart, end = _cache_layout(nrows, nverts)
+    if os.path.getsize(cachename) != end:
+        return None
+    mm = np.memmap(cachename, dtype=np.uint8, mode='c')
+    columns = mm[colstart:colstart + nrows * np.dtype(column_dtype).itemsize]
+    columns = columns.view(column_dtype)
+    offsets = mm[offstart:offstart + (nrows + 1) * 8].view('i8')
+    verts = mm[vertstart:end].view('f8').reshape(nverts, 2)
+    storms = np.empty(nrows, dtype=storm_dtype)
+    for name, _ in column_dtype:
+        storms[name] = columns[name]
+    # Assign one at a time so numpy doesn't try to broadcast
+    # equal-length polygons into a single block.
+    for i in range(nrows):
+        storms['poly'][i] = verts[offsets[i]:offsets[i + 1]]
+    return storms
+
+def write_storm_cache(filename, storms):
+    """
+    Write *storms* (a `storm_dtype` structured array) as the cache
+    sidecar of the shapefile *filename*, stamped with the shapefile's
+    mtime and size. The file is written under a temporary name and
+    renamed into place, so a reader never maps a partial cache.
+    """
+    shpname, dbfname, cachename = _cache_sources(filename)
+    polys = [np.zeros((0, 2)) if poly is None else
+             np.asarray(poly, dtype=float).reshape(-1, 2)
+             for poly in storms['poly']]
+    offsets = np.zeros(len(polys) + 1, dtype='i8')
+    np.cumsum([len(poly) for poly in polys], out=offsets[1:])
+    columns = np.empty(len(storms), dtype=column_dtype)
+    for name, _ in column_dtype:
+        columns[name] = storms[name]
+
+    header = np.zeros(1, dtype=_cache_header_dtype)
+    header[0] = ((_cache_magic,) + _cache_stamp(shpname, dbfname) +
+                 (len(storms), offsets[-1]))
+    colstart, offstart, vertstart, end = _cache_layout(len(storms),
+                                                       offsets[-1])
+    tmpname = cachename + '.tmp'
+    with open(tmpname, 'wb') as f:
+        f.write(header.tobytes())
+        f.seek(colstart)
+        f.write(columns.tobytes())
+        f.seek(offstart)
+        f.write(offsets.tobytes())
+        f.seek(vertstart)
+        f.write(np.concatenate([np.zeros((0, 2))] + polys).tobytes())
+        f.truncate(end)
+    os.rename(tmpname, cachename)
+
+def cached_storm_loader(filename):
+    """
+    Same as :func:`storm_loader`, but go through a memory-mapped binary
+    sidecar ('polygons.stormcache' next to 'polygons.shp'). The
+    shapefile is only parsed when the cache is missing or stale, and the
+    cache is then rewritten.
+
+    """
+    storms = read_storm_cache(filename)
+    if storms is None:
+        storms = storm_loader(filename)
+        try:
+            write_storm_cache(filename, storms)
+        except (IOError, OSError):
+            # A read-only data directory just means no caching.
+            pass
+    return storms
+
+def group_indexes(values):
+    """
+    Group the positions of *values* by value, in one pass. Returns the
+    sorted unique values (the keys), an array of row indexes ordered by
+    group and the group boundaries within it. The rows holding
+    ``keys[i]`` are ``indexes[bounds[i]:bounds[i + 1]]``, and keep their
+    original order, so the input does not need to be sorted.
+
+    """
+    values = np.asarray(values)
+    indexes = np.argsort(values, kind='mergesort')
+    keys, starts = np.unique(values[indexes], return_index=True)
+    bounds = np.append(starts, len(values))
+    return keys, indexes, bounds
+
+def points_in_bbox(xs, ys, x1, y1, x2, y2):
+    """
+    Return a boolean mask of the points *xs*, *ys* lying in the box
+    with corners (*x1*, *y1*) and (*x2*, *y2*), given in any order.
+    """
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    xmin, xmax = min(x1, x2), max(x1, x2)
+    ymin, ymax = min(y1, y2), max(y1, y2)
+    return (xmin <= xs) & (xs <= xmax) & (ymin <= ys) & (ys <= ymax)
+
+def points_in_polygon(xs, ys, verts):
+    """
+    Return a boolean mask of the points *xs*, *ys* lying in the polygon
+    with vertices *verts* (an Nx2 array, closed or not), by counting the
+    edges crossed by a ray from each point. Each edge is tested against
+    all the points in its bounding box at once.
+
+    """
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    verts = np.asarray(verts, dtype=float)
+    inside = np.zeros(xs.shape, dtype=bool)
+    if len(verts) < 3:
+        return inside
+    (xmin, ymin), (xmax, ymax) = verts.min(axis=0), verts.max(axis=0)
+    candidates = np.flatnonzero(points_in_bbox(xs, ys, xmin, ymin,
+                                               xmax, ymax))
+    px, py = xs.ravel()[candidates], ys.ravel()[candidates]
+    crossings = np.zeros(len(candidates), dtype=bool)
+    starts, ends = verts, np.roll(verts, -1, axis=0)
+    for (x0, y0), (x1, y1) in zip(starts, ends):
+        spans = (y0 > py) != (y1 > py)
+        if not spans.any():
+            continue
+        # Where the edge is at the height of the points that it spans
+        xcross = x0 + (py[spans] - y0) * (x1 - x0) / (y1 - y0)
+        crossings[spans] ^= px[spans] < xcross
+    inside.ravel()[candidates] = crossings
+    return inside
+
 def track_loader(filename, group='track_id'):
+    """
+    Return a dictionary of Nx2 arrays of the storm centroids, keyed by
+    the *group* column.
+    """
     storms = storm_loader(filename)
+    keys, indexes, bounds = group_indexes(storms[group])
+    points = np.column_stack([storms['xcent'], storms['ycent']])[indexes]
     tracks = defaultdict(list)
-    for key, items in groupby(storms, lambda x: x[group]):
-        for storm in items:
-            tracks[key].append((storm['xcent'], storm['ycent']))
+    for key, start, stop in zip(keys, bounds[:-1], bounds[1:]):
+        tracks[key] = points[start:stop]
     return tracks
 
 def polygon_loader(filename, group='frame_index'):
+    """
+    Return a dictionary of lists of polygon vertex arrays, keyed by the
+    *group* column.
+    """
     storms = storm_loader(filename)
+    keys, indexes, bounds = group_indexes(storms[group])
+    polys = storms['poly'][indexes]
     polygons = defaultdict(list)
-    for key, items in groupby(storms, lambda x: x[group]):
-        for storm in items:
-            polygons[key].append(storm['poly'])
+    for key, start, stop in zip(keys, bounds[:-1], bounds[1:]):
+        polygons[key] = list(polys[start:stop])
     return polygons
 
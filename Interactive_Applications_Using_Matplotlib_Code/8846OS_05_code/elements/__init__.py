@@ -1,3 +1,3 @@
 from .raddisplay import RadarDisplay
-from .stormcells import Stormcells
+from .stormcells import Stormcells, FrameIndex, CellGrid
 from .tracks import Tracks
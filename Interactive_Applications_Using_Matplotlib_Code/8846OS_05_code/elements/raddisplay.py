@@ -1,9 +1,37 @@
+from collections import OrderedDict
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.axes import Axes
+
+def max_pool(data, factor=2):
+    """
+    Downsample a 2D array by *factor* along each axis, keeping the
+    maximum of each block, so that storm cores survive. Edges that do
+    not fill a whole block are padded with the array's minimum.
+    Float data is pooled with NaNs ignored.
+    """
+    rows, cols = data.shape
+    padrows, padcols = -rows % factor, -cols % factor
+    if padrows or padcols:
+        data = np.pad(data, ((0, padrows), (0, padcols)), mode='constant',
+                      constant_values=np.nanmin(data))
+    blocks = data.reshape(data.shape[0] // factor, factor,
+                          data.shape[1] // factor, factor)
+    # fmax is only needed to skip NaNs; maximum is faster on integers.
+    op = np.fmax if blocks.dtype.kind == 'f' else np.maximum
+    return op.reduce(op.reduce(blocks, axis=3), axis=1)
 
 class RadarDisplay(object):
-    def __init__(self, ax, lats, lons):
+    def __init__(self, ax, lats, lons, pyramid_levels=0, pyramid_cache=32):
         self.im = None
+        self.quantizer = None
+        self.pyramid_levels = pyramid_levels
+        self.pyramid_cache = pyramid_cache
+        self._lut = None
+        self._frame = None
+        self._pyramid = []
+        # Downsampled levels of the most recently shown frames, by index
+        self._levels = OrderedDict()
         cmap = plt.get_cmap('gist_ncar')
         cmap.set_under('lightgrey')
         self.initialize_display(ax, lats, lons)
@@ -11,11 +39,141 @@ class RadarDisplay(object):
     def initialize_display(self, ax, lats, lons):
         if self.im is not None:
             self.im.remove()
+        self.ax = ax
+        self._levels.clear()
+        self._extent = (lons[0], lons[-1], lats[0], lats[-1])
+        self._shape = (lats.shape[0], lons.shape[0])
         fake_data = np.zeros((lats.shape[0], lons.shape[0]))
-        self.im = ax.imshow(fake_data, origin='lower',
-                            extent=(lons[0], lons[-1], lats[0], lats[-1]),
+        self.im = ax.imshow(fake_data, origin='lower', extent=self._extent,
                             vmin=0.1, vmax=80, cmap='gist_ncar')
+        if self.pyramid_levels:
+            # Pick the pyramid level and window again whenever the view
+            # or the size of the axes changes.
+            ax.callbacks.connect('xlim_changed', self._view_changed)
+            ax.callbacks.connect('ylim_changed', self._view_changed)
+            ax.figure.canvas.mpl_connect('resize_event', self._view_changed)
+
+    def to_rgba(self, data):
+        # Colormapped the same way the image would, but ahead of time.
+        # An MxNx4 array given to update_display() skips the norm and
+        # the colormap entirely.
+        return self.im.to_rgba(np.asarray(data), bytes=True)
+
+    def use_quantizer(self, quantizer):
+        # From now on, update_display() takes the uint8 codes made by
+        # *quantizer*, and colormapping is a lookup into a 256-entry table.
+        self.quantizer = quantizer
+        self._lut = quantizer.lut(self.to_rgba)
+
+    def update_display(self, data, index=None):
+        # Given the frame's *index*, the pyramid of the frame is only
+        # built the first time it is shown, and kept for the last
+        # *pyramid_cache* frames.
+        self._frame = data
+        if self.pyramid_levels and np.ndim(data) == 2:
+            # Level n is downsampled by 2**n; level 0 is the frame itself.
+            self._pyramid = [np.asarray(data)] + self._get_levels(data, index)
+            self._show_view()
+        else:
+            self._pyramid = []
+            self._set_image(data, self._extent)
+
+    def _get_levels(self, data, index):
+        levels = self._levels.pop(index, None)
+        if levels is None:
+            levels = [max_pool(np.asarray(data))]
+            for level in range(1, self.pyramid_levels):
+                levels.append(max_pool(levels[-1]))
+        if index is not None:
+            self._levels[index] = levels
+            while len(self._levels) > self.pyramid_cache:
+                self._levels.popitem(last=False)
+        return levels
 
-    def update_display(self, data):
+    def _set_image(self, data, extent):
+        if self._lut is not None:
+            data = self._lut[data]
         self.im.set_data(data)
+        if extent != tuple(self.im.get_extent()):
+            # Moving the image must not make autoscaling move the view.
+            autox = self.ax.get_autoscalex_on()
+            autoy = self.ax.get_autoscaley_on()
+            self.ax.set_autoscale_on(False)
+            self.im.set_extent(extent)
+            self.ax.set_autoscalex_on(autox)
+            self.ax.set_autoscaley_on(autoy)
+
+    def _view_changed(self, *args):
+        if self._pyramid:
+            self._show_view()
+
+    def _show_view(self):
+        """
+        Show the pyramid level whose pixels are closest to the screen
+        pixels of the axes without being smaller, cut down to the
+        visible part of the frame.
+        """
+        x0, x1, y0, y1 = self._extent
+        rows, cols = self._pyramid[0].shape
+        dx, dy = (x1 - x0) / cols, (y1 - y0) / rows
+        xlo, xhi = sorted(self.ax.get_xlim())
+        ylo, yhi = sorted(self.ax.get_ylim())
+        bbox = self.ax.bbox
+        density = max((xhi - xlo) / abs(dx) / max(bbox.width, 1),
+                      (yhi - ylo) / abs(dy) / max(bbox.height, 1))
+        level = 0
+        while level < len(self._pyramid) - 1 and 2 ** (level + 1) <= density:
+            level += 1
+
+        data = self._pyramid[level]
+        factor = 2 ** level
+        # The visible window of the level, one pixel wider on each side.
+        cols_lo, cols_hi = sorted([(xlo - x0) / (dx * factor),
+                                   (xhi - x0) / (dx * factor)])
+        rows_lo, rows_hi = sorted([(ylo - y0) / (dy * factor),
+                                   (yhi - y0) / (dy * factor)])
+        i0 = int(min(max(np.floor(cols_lo) - 1, 0), data.shape[1] - 1))
+        i1 = int(min(max(np.ceil(cols_hi) + 1, i0 + 1), data.shape[1]))
+        j0 = int(min(max(np.floor(rows_lo) - 1, 0), data.shape[0] - 1))
+        j1 = int(min(max(np.ceil(rows_hi) + 1, j0 + 1), data.shape[0]))
+        extent = (x0 + i0 * dx * factor, x0 + i1 * dx * factor,
+                  y0 + j0 * dy * factor, y0 + j1 * dy * factor)
+        self._set_image(data[j0:j1, i0:i1], extent)
+
+    def value_at(self, x, y):
+        """
+        Return the radar value of the displayed frame at data
+        coordinates *x*, *y*, or None if there is no such value (no
+        frame yet, only a precolored one, or a point off the frame).
+        """
+        if self._frame is None or np.ndim(self._frame) != 2:
+            return None
+        index = self.coords2index(x, y)
+        if index is None:
+            return None
+        value = self._frame[index]
+        if self.quantizer is not None:
+            value = self.quantizer.decode(value)
+        return value
+
+    def coords2index(self, x, y):
+        """
+        Convert data coordinates to the (row, column) of the frame
+        pixel there, or None if the point is outside the frame.
+        """
+        xmin, xmax, ymin, ymax = self._extent
+        rows, cols = self._shape
+        fy = (y - ymin) / (ymax - ymin)
+        fx = (x - xmin) / (xmax - xmin)
+        if not (0 <= fy <= 1 and 0 <= fx <= 1):
+            return None
+        # The far edges belong to the last row and column.
+        return min(int(fy * rows), rows - 1), min(int(fx * cols), cols - 1)
 
+    def format_coord(self, x, y):
+        # Meant to replace ax.format_coord, in the manner of DataAxes.
+        normal_part = Axes.format_coord(self.ax, x, y)
+        value = self.value_at(x, y)
+        if value is None:
+            return normal_part
+        return "Value: %f, %s" % (value, normal_part)
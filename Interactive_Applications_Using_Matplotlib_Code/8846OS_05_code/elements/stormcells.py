@@ -1,19 +1,134 @@
+from functools import partial
 import numpy as np
 from matplotlib.collections import PolyCollection
 from matplotlib.path import Path
 
+class FrameIndex(object):
+    """
+    The rows of the storm data in each frame, in compressed sparse row
+    form: all the row indexes sorted by frame, and the bounds of each
+    frame within them. ``index[frame]`` is a view of the rows in
+    *frame*, in the order of their polygons in that frame's collection.
+
+    Built with one stable sort, and kept up to date through
+    :meth:`insert` and :meth:`delete` as cells are added and removed.
+
+    """
+    def __init__(self, frame_index, nframes=None):
+        frame_index = np.asarray(frame_index)
+        if nframes is None:
+            nframes = np.max(frame_index) + 1 if len(frame_index) else 0
+        self.rows = np.argsort(frame_index, kind='mergesort')
+        counts = np.bincount(frame_index, minlength=nframes)
+        self.bounds = np.concatenate([[0], np.cumsum(counts)])
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def __getitem__(self, frame):
+        return self.rows[self.bounds[frame]:self.bounds[frame + 1]]
+
+    def __iter__(self):
+        for frame in range(len(self)):
+            yield self[frame]
+
+    def insert(self, frame, row):
+        """
+        Add storm data row *row* as the last cell of *frame*. Rows at or
+        after *row* move up by one, as they do in the storm data.
+        """
+        if frame >= len(self):
+            extra = np.repeat(self.bounds[-1], frame - len(self) + 1)
+            self.bounds = np.concatenate([self.bounds, extra])
+        self.rows[self.rows >= row] += 1
+        self.rows = np.insert(self.rows, self.bounds[frame + 1], row)
+        self.bounds[frame + 1:] += 1
+
+    def delete(self, frame, cell):
+        """
+        Remove the *cell*-th cell of *frame*, returning its storm data
+        row. Rows after it move down by one, as they do in the storm data.
+        """
+        position = self.bounds[frame] + cell
+        row = self.rows[position]
+        self.rows = np.delete(self.rows, position)
+        self.bounds[frame + 1:] -= 1
+        self.rows[self.rows > row] -= 1
+        return row
+
+class CellGrid(object):
+    """
+    Uniform grid over the bounding boxes of a set of polygons, about one
+    polygon per grid square. Each grid square lists the polygons whose
+    bounding box overlaps it, so a point is tested exactly only against
+    the few polygons near it.
+
+    """
+    def __init__(self, polygons):
+        self.polygons = [Path(verts, closed=True) for verts in polygons]
+        count = len(self.polygons)
+        if count:
+            bboxes = np.array([[verts.min(axis=0), verts.max(axis=0)]
+                               for verts in (np.asarray(p.vertices)
+                                             for p in self.polygons)])
+        else:
+            bboxes = np.zeros((0, 2, 2))
+        self.mins, self.maxs = bboxes[:, 0], bboxes[:, 1]
+        self.shape = np.array([max(int(np.sqrt(count)), 1)] * 2)
+        self.origin = self.mins.min(axis=0) if count else np.zeros(2)
+        span = (self.maxs.max(axis=0) - self.origin) if count else np.ones(2)
+        self.size = np.where(span > 0, span, 1.0) / self.shape
+
+        # Every (square, polygon) pair where the bounding box overlaps
+        # the square, with the squares as compressed sparse rows.
+        first = self._squares(self.mins)
+        last = self._squares(self.maxs)
+        widths = last - first + 1
+        spans = widths[:, 0] * widths[:, 1]
+        cells = np.repeat(np.arange(count), spans)
+        within = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans,
+                                                    spans)
+        cols = first[cells, 0] + within % widths[cells, 0]
+        rows = first[cells, 1] + within // widths[cells, 0]
+        squares = rows * self.shape[0] + cols
+        order = np.argsort(squares, kind='mergesort')
+        self.cells = cells[order]
+        self.bounds = np.concatenate(
+                [[0], np.cumsum(np.bincount(squares,
+                                            minlength=self.shape.prod()))])
+
+    def _squares(self, points):
+        squares = np.floor((points - self.origin) / self.size).astype(int)
+        return np.clip(squares, 0, self.shape - 1)
+
+    def candidates(self, x, y):
+        """
+        The polygons whose bounding box holds the point *x*, *y*.
+        """
+        point = np.array([x, y])
+        col, row = self._squares(point)
+        square = row * self.shape[0] + col
+        cells = self.cells[self.bounds[square]:self.bounds[square + 1]]
+        inside = (np.all(self.mins[cells] <= point, axis=1) &
+                  np.all(point <= self.maxs[cells], axis=1))
+        return cells[inside]
+
+    def contains(self, x, y):
+        """
+        The indexes of the polygons holding the point *x*, *y*, in
+        ascending order.
+        """
+        return [cell for cell in np.sort(self.candidates(x, y))
+                if self.polygons[cell].contains_point((x, y))]
+
 class Stormcells(object):
     def __init__(self, ax, stormdata):
         self.polygons = []
+        self.stormmap = None
+        self._grids = {}
         self.create_polygons(ax, stormdata)
         self._visible = True
 
-    @staticmethod
-    def create_stormmap(stormdata):
-        stormmap = [np.where(stormdata['frame_index'] == frame)[0]
-                    for frame in range(np.max(stormdata['frame_index']) + 1)]
-        return stormmap
-
     def remove_polygons(self):
         for strm in self.polygons:
             strm.remove()
@@ -23,9 +138,12 @@ class Stormcells(object):
         # Clear any previously existing polygons
         self.remove_polygons()
 
-        for indexes in self.create_stormmap(stormdata):
+        self.stormmap = FrameIndex(stormdata['frame_index'])
+        self._grids = {}
+        for frame, indexes in enumerate(self.stormmap):
             polygons = stormdata[indexes]['poly']
-            pc = PolyCollection(polygons, lw=[1]*len(polygons), picker=True,
+            pc = PolyCollection(polygons, lw=[1]*len(polygons),
+                    picker=partial(self.pick_polygon, frame),
                     facecolors='k', zorder=1, edgecolors='w', alpha=0.45,
                     visible=False)
             ax.add_collection(pc)
@@ -37,6 +155,7 @@ class Stormcells(object):
         paths.pop(cell_i)
         lws = self.polygons[frame_i].get_linewidths()
         lws.pop(cell_i)
+        self._grids.pop(frame_i, None)
 
     def add_polygon(self, celldata):
         frame_i, verts = celldata
@@ -44,6 +163,35 @@ class Stormcells(object):
         paths.append(Path(verts, closed=True))
         lws = self.polygons[frame_i].get_linewidths()
         lws.append(1)
+        self._grids.pop(frame_i, None)
+
+    def get_grid(self, frame_index):
+        """
+        Return the :class:`CellGrid` of the polygons in *frame_index*,
+        made the first time it is needed after the frame changes.
+        """
+        grid = self._grids.get(frame_index)
+        if grid is None:
+            paths = self.polygons[frame_index].get_paths()
+            grid = CellGrid([path.vertices for path in paths])
+            self._grids[frame_index] = grid
+        return grid
+
+    def cells_at(self, frame_index, x, y):
+        """
+        The indexes of the polygons of *frame_index* holding the point
+        *x*, *y*, in the same order as the collection.
+        """
+        return self.get_grid(frame_index).contains(x, y)
+
+    def pick_polygon(self, frame_index, artist, mouseevent):
+        # Picker for the collection of *frame_index*, in place of testing
+        # the click against every path in it.
+        if (not artist.get_visible() or mouseevent.inaxes is not artist.axes
+                or mouseevent.xdata is None):
+            return False, {}
+        ind = self.cells_at(frame_index, mouseevent.xdata, mouseevent.ydata)
+        return len(ind) > 0, dict(ind=ind)
 
     def toggle_polygons(self, frame_index, visible=None):
         if visible is None:
@@ -1,20 +1,80 @@
 import numpy as np
 from matplotlib.collections import LineCollection
+from matplotlib.path import Path
 
 class Tracks(object):
-    def __init__(self, ax):
+    def __init__(self, ax, tails=None):
         self.tracks = None
+        self.tails = tails
+        self._stormdata = None
+        self._trackmap = None
+        self._frame_index = None
         self.initialize_lines(ax)
 
     @staticmethod
     def create_trackmap(stormdata):
-        trackmap = []
-        for trackid in range(np.max(stormdata['track_id']) + 1):
-            indexes = np.where(stormdata['track_id'] == trackid)[0]
-            # Makes sure the track segments are in chronological order
-            indexes = indexes[np.argsort(stormdata['frame_index'][indexes])]
-            trackmap.append(indexes)
-        return trackmap
+        # One sort by track, then by frame, makes sure the track segments
+        # are in chronological order; each track is then a slice of it.
+        order = np.lexsort((stormdata['frame_index'], stormdata['track_id']))
+        trackids = stormdata['track_id'][order]
+        bounds = np.searchsorted(trackids,
+                                 np.arange(np.max(stormdata['track_id']) + 2))
+        return [order[start:stop] for start, stop in zip(bounds[:-1],
+                                                         bounds[1:])]
+
+    def get_trackmap(self, stormdata):
+        """
+        Return the trackmap of *stormdata*, made only when a different
+        storm data array comes in. Editing replaces the array rather
+        than changing it in place, so that is enough to notice edits.
+        """
+        if stormdata is not self._stormdata:
+            self._trackmap = self.create_trackmap(stormdata)
+            self._index_tracks(stormdata)
+            self._stormdata = stormdata
+        return self._trackmap
+
+    def _index_tracks(self, stormdata):
+        """
+        Lay out the centroids of all the tracks back to back, in the
+        order of the trackmap, so that each track is a slice of one (N, 2)
+        vertex array, and the visible part of a track is a slice of that.
+        """
+        lengths = [len(indexes) for indexes in self._trackmap]
+        self._bounds = np.cumsum([0] + lengths)
+        order = (np.concatenate(self._trackmap) if self._trackmap else
+                 np.zeros(0, dtype=int))
+        # Paths keep float arrays without copying them
+        self._verts = np.empty((len(order), 2))
+        self._verts[:, 0] = stormdata['xcent'][order]
+        self._verts[:, 1] = stormdata['ycent'][order]
+        self._tracknums = np.repeat(np.arange(len(lengths)), lengths)
+        # The positions in the vertex array grouped by frame, to find
+        # which tracks change between one frame and another.
+        frames = stormdata['frame_index'][order]
+        self._byframe = np.argsort(frames, kind='mergesort')
+        self._frames = frames[self._byframe]
+        # The visible slice of each track, and the frames it was made for
+        self._starts = self._bounds[:-1].copy()
+        self._stops = self._bounds[:-1].copy()
+        self._frame_index = None
+        self.tracks.set_segments([[(np.nan, np.nan)]] * len(lengths))
+
+    def _advance(self, ends, old, new):
+        """
+        Move *ends*, the end of the slice of each track holding the
+        frames up to *old*, to the end of the frames up to *new*.
+        Returns the track numbers that were changed, with repeats.
+        """
+        lo, hi = sorted([old, new])
+        positions = self._byframe[np.searchsorted(self._frames, lo, 'right'):
+                                  np.searchsorted(self._frames, hi, 'right')]
+        tracknums = self._tracknums[positions]
+        if new > old:
+            np.maximum.at(ends, tracknums, positions + 1)
+        else:
+            np.minimum.at(ends, tracknums, positions)
+        return tracknums
 
     def remove_lines(self):
         if self.tracks is not None:
@@ -25,16 +85,33 @@ class Tracks(object):
         self.remove_lines()
         self.tracks = LineCollection([])
         ax.add_collection(self.tracks)
+        self._stormdata = None
 
     def update_lines(self, frame_index, stormdata):
-        segments = []
-        for indexes in self.create_trackmap(stormdata):
-            trackdata = stormdata[indexes]
-            trackdata = trackdata[trackdata['frame_index'] <= frame_index]
+        self.get_trackmap(stormdata)
+        if self._frame_index is None:
+            # Nothing is shown yet, which is where an empty slice before
+            # the first frame would be.
+            self._frame_index = (self._frames[0] - 1 if len(self._frames)
+                                 else frame_index)
+        old = self._frame_index
+        changed = self._advance(self._stops, old, frame_index)
+        if self.tails:
+            # Frames before the tail are dropped from the front
+            changed = np.concatenate([changed, self._advance(
+                self._starts, old - self.tails - 1,
+                frame_index - self.tails - 1)])
+        self._frame_index = frame_index
+
+        # Only the tracks that changed get a new path, which is a view of
+        # the vertex array rather than a copy.
+        paths = self.tracks.get_paths()
+        for tracknum in np.unique(changed):
+            verts = self._verts[self._starts[tracknum]:self._stops[tracknum]]
             # There must always be something in a track, even it it is NaNs.
-            segments.append(zip(trackdata['xcent'], trackdata['ycent'])
-                            or [(np.nan, np.nan)])
-        self.tracks.set_segments(segments)
+            paths[tracknum] = Path(verts if len(verts) else
+                                   [(np.nan, np.nan)])
+        self.tracks.stale = True
 
     def lolite_line(self, indx):
         self.hilite_line(indx, 1)
@@ -44,4 +121,3 @@ class Tracks(object):
             lws = self.tracks.get_linewidths()
             lws[indx] = lw
             self.tracks.set_linewidths(lws)
-
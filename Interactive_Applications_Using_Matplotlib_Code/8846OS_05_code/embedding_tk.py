@@ -2,10 +2,14 @@ from __future__ import print_function
 from collections import OrderedDict
 import numpy as np
 #import matplotlib.pyplot as plt
-from scipy.io import netcdf_file
 from matplotlib import widgets
-from tutorial import storm_loader, storm_saver, storm_dtype, calc_area
+from scipy.spatial import cKDTree
+from tutorial import cached_storm_loader, storm_dtype, calc_area
+from tutorial import lonlat_to_km
+from tutorial import IncrementalStormSaver, SaveWorker
 from elements import RadarDisplay, Stormcells, Tracks
+from radarframes import FrameCache, Quantizer, open_frame_cube
+from radarframes import open_pixel_series
 
 try:
     import Tkinter as tk
@@ -164,16 +168,26 @@ def build_radio_buttons(fig, height):
     return buttons
 
 class ControlSys(KeymapControl, PickControl, ButtonControl):
-    def __init__(self, fig, raddisp, data, polygons, lines, stormdata):
+    def __init__(self, fig, raddisp, data, polygons, lines, stormdata,
+                 series=None):
         self.fig = fig
         self.raddisp = raddisp
         self.data = data
+        self.series = series
         self.i = 0
         self.selected = None
         self.polygons = polygons
         self.lines = lines
         self.stormdata = stormdata
-        self.stormmap = polygons.create_stormmap(stormdata)
+        # Shared with the polygons, so both agree on which row is which
+        self.stormmap = polygons.stormmap
+        self._celltrees = {}
+        self._hover = False
+        self._probe_ax = None
+        self._probe_line = None
+        self._probe_marker = None
+        self.saver = IncrementalStormSaver()
+        self.save_worker = SaveWorker(fig.canvas)
         self._hidekey = None
         self._hidecid = None
         KeymapControl.__init__(self, fig)
@@ -189,6 +203,7 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
         self._connect('frame_change', self.display_stormcells)
         self._connect('frame_change', self.update_track_display)
         self._connect('frame_change', self.update_progress_bar)
+        self._connect('frame_change', self.update_probe)
         self._connect('select', self.polygons.hilite_polygon)
         self._connect('deselect', self.polygons.lolite_polygon)
         self._connect('hide', self.polygons.toggle_polygons)
@@ -198,7 +213,11 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
         self._connect('create', self.add_stormcell)
         self._connect('save', lambda x: self.save_stormdata('polygons_new.shp'))
         self._connect('help', lambda x: self.display_help_menu())
+        self._connect('saved', lambda fname: print("Saved %s" % fname))
+        self._connect('save_failed', self.save_failed)
+        self._connect('close_event', lambda x: self.compact_stormdata())
         self._connect('button_press_event', self._start_stormcell)
+        self._connect('button_press_event', self.probe)
         self._connect('about', lambda x: self.display_about())
 
         self._mode_buttons.on_clicked(self.set_mode)
@@ -220,6 +239,8 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
                             self.delete_selected)
         self.add_key_action('w', 'Save the storm data',
                             lambda : self._emit('save', None))
+        self.add_key_action('n', 'Toggle the nearest stormcell readout',
+                            self.toggle_hover)
         self.add_key_action('h', 'Display this help menu',
                             lambda : self._emit('help', None))
 
@@ -270,26 +291,41 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
     def delete_stormcell(self, inds):
         frame_i, cell_i = inds
         # Take it out of the raw stormdata object and everywhere else
-        stormcell_index = self.stormmap[frame_i][cell_i]
-        self.stormdata = np.delete(self.stormdata, stormcell_index)
-        self.stormmap[frame_i] = np.delete(self.stormmap[frame_i], cell_i)
-        # Also need to decrement any indexes greater than stormcell_index
-        for indexes in self.stormmap:
-            indexes[indexes > stormcell_index] -= 1
+        stormcell_index = self.stormmap.delete(frame_i, cell_i)
+        self.saver.delete(stormcell_index)
+        self._celltrees.pop(frame_i, None)
+        self.stormdata = self.stormdata.delete(stormcell_index)
 
     def add_stormcell(self, celldata):
         frame_i, verts = celldata
         stormcell_index = np.max(self.stormdata['feat_id']) + 1
         xcent, ycent = np.mean(verts, axis=0)
-        newcell = np.array([(xcent, ycent, frame_i, np.nan, calc_area(verts),
-                            stormcell_index, -9, np.array(verts))],
+        newcell = np.array([(xcent, ycent, frame_i, np.nan,
+                             abs(calc_area(verts)), stormcell_index, -9,
+                             np.array(verts))],
                            dtype=storm_dtype)
-        self.stormdata = np.append(self.stormdata, newcell)
-        self.stormmap[frame_i] = np.append(self.stormmap[frame_i],
-                                           stormcell_index)
+        self.stormdata = self.stormdata.append(newcell)
+        self.saver.append()
+        self.stormmap.insert(frame_i, len(self.stormdata) - 1)
+        self._celltrees.pop(frame_i, None)
 
     def save_stormdata(self, fname):
-        storm_saver(fname, self.stormdata)
+        # The file writing happens on a worker thread against a snapshot,
+        # so editing can go on while the save is in flight.
+        job = self.saver.prepare_save(fname, self.stormdata.copy())
+        self.save_worker.submit(fname, job)
+
+    def compact_stormdata(self):
+        if self.saver.filename is not None:
+            self.save_worker.submit(self.saver.filename,
+                                    self.saver.prepare_compact())
+
+    def save_failed(self, failure):
+        fname, err = failure
+        # Whatever was written no longer matches the saver's bookkeeping,
+        # so the next save has to start over with a full write.
+        self.saver.invalidate()
+        print("Saving %s failed: %s" % (fname, err))
 
     def _start_stormcell(self, event):
         if self.fig.canvas.widgetlock.locked():
@@ -322,7 +358,7 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
             self.fig.canvas.draw_idle()
 
     def update_radar_display(self, index):
-        self.raddisp.update_display(self.data[index])
+        self.raddisp.update_display(self.data[index], index)
 
     def update_track_display(self, index):
         self.lines.update_lines(index, self.stormdata)
@@ -365,6 +401,81 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
             raise ValueError("Invalid name %s for visibility toggling" % item)
         self.fig.canvas.draw_idle()
 
+    # --- Hover methods ---
+    def toggle_hover(self):
+        self._hover = not self._hover
+
+    def nearest_stormcell(self, x, y):
+        """
+        Return the storm data row of the stormcell in the current frame
+        whose centroid is nearest to *x*, *y*, and its distance in km,
+        or (None, None) if the frame has no stormcells.
+        """
+        if self.i >= len(self.stormmap) or not len(self.stormmap[self.i]):
+            return None, None
+        if self.i not in self._celltrees:
+            # Made on first use, and kept until the frame is edited. The
+            # centroids are projected to km about their mean latitude, as
+            # a degree of longitude is shorter than one of latitude.
+            rows = self.stormmap[self.i]
+            lat0 = np.mean(self.stormdata['ycent'][rows])
+            tree = cKDTree(lonlat_to_km(self.stormdata['xcent'][rows],
+                                        self.stormdata['ycent'][rows], lat0))
+            self._celltrees[self.i] = (tree, lat0)
+        tree, lat0 = self._celltrees[self.i]
+        dist, cell = tree.query(lonlat_to_km(x, y, lat0))
+        return self.stormmap[self.i][cell], dist
+
+    def format_coord(self, x, y):
+        # Meant to replace ax.format_coord, like RadarDisplay.format_coord
+        normal_part = self.raddisp.format_coord(x, y)
+        if not self._hover:
+            return normal_part
+        row, dist = self.nearest_stormcell(x, y)
+        if row is None:
+            return normal_part
+        cell = self.stormdata[row]
+        return ("Cell %d, Track %d, Size %.1f, Distance %.1f km, %s" %
+                (cell['feat_id'], cell['track_id'], cell['feat_size'], dist,
+                 normal_part))
+
+    # --- Probe methods ---
+    def probe(self, event):
+        # A middle click on the radar shows the time series of that pixel,
+        # and a middle click on the time series hides it again.
+        if self.series is None or event.button != 2:
+            return
+        if self.fig.canvas.widgetlock.locked():
+            return
+        if self._probe_ax is not None and event.inaxes is self._probe_ax:
+            self._probe_ax.set_visible(False)
+            self.fig.canvas.draw_idle()
+            return
+        if event.inaxes is not self.raddisp.im.get_axes():
+            return
+
+        index = self.raddisp.coords2index(event.xdata, event.ydata)
+        if index is None:
+            # Off the radar, where there is no time series to show
+            return
+        values = self.series[index]
+        if self._probe_ax is None:
+            self._probe_ax = self.fig.add_axes([0.15, 0.7, 0.3, 0.15])
+            self._probe_line, = self._probe_ax.plot(values)
+            self._probe_marker = self._probe_ax.axvline(self.i, color='r')
+            self._probe_ax.set_xlabel('Frame')
+        else:
+            self._probe_line.set_data(np.arange(len(values)), values)
+            self._probe_ax.relim()
+            self._probe_ax.autoscale_view()
+        self._probe_ax.set_title("(%.3f, %.3f)" % (event.xdata, event.ydata))
+        self._probe_ax.set_visible(True)
+        self.fig.canvas.draw_idle()
+
+    def update_probe(self, index):
+        if self._probe_marker is not None:
+            self._probe_marker.set_xdata([index, index])
+
     # --- Selection/Deselection methods ---
     def select_stormcell(self, event):
         if event.artist not in self.polygons.polygons:
@@ -379,19 +490,23 @@ class ControlSys(KeymapControl, PickControl, ButtonControl):
         self.fig.canvas.draw_idle()
 
 if __name__ == '__main__':
-    ncf = netcdf_file('KTLX_20100510_22Z.nc')
-    data = ncf.variables['Reflectivity']
+    ncf = open_frame_cube('KTLX_20100510_22Z.nc')
+    reflectivity = ncf.variables['Reflectivity']
     lats = ncf.variables['lat']
     lons = ncf.variables['lon']
-    stormcells = storm_loader('polygons.shp')
+    stormcells = cached_storm_loader('polygons.shp', columnar=True)
 
     win = tk.Tk()
 
     fig = Figure()
     canvas = FigureCanvas(fig, master=win)
     ax = fig.add_subplot(1, 1, 1)
-    raddisp = RadarDisplay(ax, lats, lons)
-    raddisp.update_display(data[0])
+    raddisp = RadarDisplay(ax, lats, lons, pyramid_levels=3)
+    # Keep the frames as uint8 codes, and colormap them by table lookup
+    quantizer = Quantizer()
+    raddisp.use_quantizer(quantizer)
+    data = FrameCache(reflectivity, size=256, transform=quantizer)
+    raddisp.update_display(data[0], 0)
     fig.colorbar(raddisp.im)
     polycolls = Stormcells(ax, stormcells)
     linecoll = Tracks(ax)
@@ -400,7 +515,9 @@ if __name__ == '__main__':
     polycolls.toggle_polygons(0, True)
     ax.autoscale(True)
 
-    ctrl_sys = ControlSys(fig, raddisp, data, polycolls, linecoll, stormcells)
+    ctrl_sys = ControlSys(fig, raddisp, data, polycolls, linecoll, stormcells,
+                          series=open_pixel_series('KTLX_20100510_22Z.nc'))
+    ax.format_coord = ctrl_sys.format_coord
 
     win.wm_title("Embedding with Tk")
     canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
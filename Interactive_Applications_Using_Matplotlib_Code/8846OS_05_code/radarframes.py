@@ -0,0 +1,336 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.io import netcdf_file
+
+class FrameCache(object):
+    """
+    Wrap a frames-first radar variable (such as the 'Reflectivity'
+    variable of a netcdf_file) with a least-recently-used cache of
+    *size* frames. Each time a frame is requested, a background thread
+    starts reading the next *readahead* frames in the direction of
+    playback, so stepping through the frames does not wait on the disk.
+
+    If given, *transform* is applied to each frame as it is read, and
+    the cache holds its result instead. The apps give it a
+    :class:`Quantizer`, so that frames are cached as uint8 codes that
+    the radar display colormaps by table lookup. The transform has to
+    work value by value, whatever the shape of its input.
+
+    Integer indexing and ``shape`` work as they do on the wrapped
+    variable. Any other indexing reads from the wrapped variable without
+    going through the cache, and applies *transform* to the result, so
+    that every access gives values in the same representation.
+
+    """
+    def __init__(self, data, size=32, readahead=4, transform=None):
+        if size <= readahead:
+            raise ValueError("The cache size (%d) must be larger than the"
+                             " read-ahead (%d)" % (size, readahead))
+        self.data = data
+        self.shape = data.shape
+        self.size = size
+        self.readahead = readahead
+        self.transform = transform
+        self._frames = OrderedDict()
+        self._lock = threading.Condition()
+        self._targets = []
+        self._last = None
+        self._thread = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if not isinstance(index, (int, np.integer)):
+            return self._read(index)
+        if index < 0:
+            index += len(self)
+        frame = self.get_frame(index)
+        self._schedule(index)
+        return frame
+
+    def get_frame(self, index):
+        """
+        Return frame *index*, from the cache if possible. This does not
+        trigger any read-ahead.
+        """
+        with self._lock:
+            frame = self._frames.pop(index, None)
+            if frame is not None:
+                # Re-insert to mark it as the most recently used.
+                self._frames[index] = frame
+                return frame
+        frame = self._read(index)
+        self._store(index, frame)
+        return frame
+
+    def _read(self, index):
+        frame = np.array(self.data[index])
+        if self.transform is not None:
+            frame = self.transform(frame)
+        return frame
+
+    def _store(self, index, frame):
+        with self._lock:
+            self._frames[index] = frame
+            while len(self._frames) > self.size:
+                self._frames.popitem(last=False)
+
+    def _schedule(self, index):
+        step = -1 if self._last is not None and index < self._last else 1
+        self._last = index
+        targets = [i for i in range(index + step,
+                                    index + step * (self.readahead + 1), step)
+                   if 0 <= i < len(self)]
+        with self._lock:
+            # Anything still queued from an earlier request is stale now.
+            self._targets = targets
+            self._lock.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._prefetch)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _prefetch(self):
+        while True:
+            with self._lock:
+                while not self._targets:
+                    self._lock.wait()
+                index = self._targets.pop(0)
+                if index in self._frames:
+                    continue
+            self._store(index, self._read(index))
+
+def _cube_names(filename):
+    base = os.path.splitext(filename)[0]
+    return base + '.cube.npy', base + '.cube.npz'
+
+def _source_stamp(filename):
+    stat = os.stat(filename)
+    return np.array([stat.st_mtime, stat.st_size])
+
+def convert_to_cube(filename, variable='Reflectivity'):
+    """
+    Convert the radar NetCDF file *filename* into a frame cube: the
+    *variable* array goes into a '.cube.npy' file, frame after frame
+    and in native byte order, and every other variable (lats, lons,
+    times...) goes into a small '.cube.npz' header next to it.
+    """
+    cubename, headername = _cube_names(filename)
+    ncf = netcdf_file(filename)
+    data = ncf.variables[variable].data
+    cube = np.lib.format.open_memmap(cubename + '.tmp', mode='w+',
+                                     dtype=data.dtype.newbyteorder('='),
+                                     shape=data.shape)
+    for i in range(data.shape[0]):
+        cube[i] = data[i]
+    cube.flush()
+
+    header = dict((name, np.array(var[:]))
+                  for name, var in ncf.variables.items()
+                  if name != variable)
+    # Not closed explicitly, as netcdf_file refuses while the mapped
+    # variables are still referenced; dropping it is enough.
+    del cube, data, ncf
+    header['_cube_variable'] = np.array(variable)
+    header['_source_stamp'] = _source_stamp(filename)
+    os.rename(cubename + '.tmp', cubename)
+    # The header is written last, so its presence marks a finished cube.
+    with open(headername + '.tmp', 'wb') as f:
+        np.savez(f, **header)
+    os.rename(headername + '.tmp', headername)
+
+class FrameCube(object):
+    """
+    Read a frame cube written by :func:`convert_to_cube`, with the
+    same ``variables`` mapping as a netcdf_file. The cube variable is
+    memory-mapped, so indexing a frame returns a view without copying
+    or reading the rest of the file.
+    """
+    def __init__(self, filename):
+        cubename, headername = _cube_names(filename)
+        header = np.load(headername)
+        self.variables = dict((name, header[name]) for name in header.files
+                              if not name.startswith('_'))
+        self.variable = str(header['_cube_variable'])
+        self.source_stamp = header['_source_stamp']
+        header.close()
+        self.variables[self.variable] = np.load(cubename, mmap_mode='r')
+
+    def close(self):
+        self.variables = {}
+
+def open_frame_cube(filename, variable='Reflectivity'):
+    """
+    Open the NetCDF file *filename* as a :class:`FrameCube`, converting
+    it first if it has no cube yet, or if the cube is older than the
+    file (by mtime and size).
+    """
+    cubename, headername = _cube_names(filename)
+    if os.path.exists(headername) and os.path.exists(cubename):
+        cube = FrameCube(filename)
+        if (cube.variable == variable and
+                np.array_equal(cube.source_stamp, _source_stamp(filename))):
+            return cube
+        cube.close()
+    convert_to_cube(filename, variable)
+    return FrameCube(filename)
+
+def _series_name(filename):
+    return os.path.splitext(filename)[0] + '.series.npy'
+
+def convert_to_series(filename, variable='Reflectivity', chunksize=16):
+    """
+    Write the frame cube of the radar NetCDF file *filename* out again
+    pixel by pixel, into a '.series.npy' file of shape (rows, columns,
+    frames), so that the whole history of one pixel is contiguous. The
+    cube is transposed *chunksize* rows at a time.
+    """
+    seriesname = _series_name(filename)
+    cube = open_frame_cube(filename, variable).variables[variable]
+    frames, rows, cols = cube.shape
+    series = np.lib.format.open_memmap(seriesname + '.tmp', mode='w+',
+                                       dtype=cube.dtype,
+                                       shape=(rows, cols, frames))
+    for start in range(0, rows, chunksize):
+        stop = min(start + chunksize, rows)
+        series[start:stop] = np.transpose(cube[:, start:stop], (1, 2, 0))
+    series.flush()
+    del series, cube
+    os.rename(seriesname + '.tmp', seriesname)
+
+class PixelSeries(object):
+    """
+    Read the pixel-major copy of a frame cube written by
+    :func:`convert_to_series`. ``series[j, i]`` is the value of pixel
+    (*j*, *i*) in every frame, read from one contiguous block of the
+    memory-mapped file.
+    """
+    def __init__(self, filename):
+        self.data = np.load(_series_name(filename), mmap_mode='r')
+        self.shape = self.data.shape
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+def open_pixel_series(filename, variable='Reflectivity'):
+    """
+    Open the NetCDF file *filename* as a :class:`PixelSeries`, writing
+    the pixel-major copy first if there is none, or if it is older than
+    the frame cube (which is itself brought up to date first).
+    """
+    open_frame_cube(filename, variable)
+    seriesname = _series_name(filename)
+    cubename = _cube_names(filename)[0]
+    if (not os.path.exists(seriesname) or
+            os.path.getmtime(seriesname) < os.path.getmtime(cubename)):
+        convert_to_series(filename, variable)
+    return PixelSeries(filename)
+
+class SparseFrames(object):
+    """
+    Run-length encoded store of radar frames. Only the echo pixels (at
+    or above *threshold*) are kept, as runs along the rows of each frame
+    in raster order; everything else decodes to *fill*, which the radar
+    display draws in its under color. On mostly clear frames this is a
+    small fraction of the dense size.
+
+    Indexing a frame decodes it into a preallocated buffer and returns
+    that buffer, which is reused by the next access from the same thread
+    (each thread gets its own), so copy it to keep it.
+    (:class:`FrameCache` copies the frames it reads.) Use :meth:`decode`
+    with *out* to decode into an array of your own.
+
+    """
+    def __init__(self, data, threshold=0.1, fill=0.0):
+        self.shape = data.shape
+        self.threshold = threshold
+        self.fill = fill
+        starts, lengths, values = [], [], []
+        for i in range(self.shape[0]):
+            flat = np.asarray(data[i]).ravel()
+            echo = flat >= threshold
+            edges = np.diff(np.concatenate([[0], echo.view(np.int8), [0]]))
+            starts.append(np.flatnonzero(edges == 1).astype(np.int32))
+            lengths.append(np.flatnonzero(edges == -1).astype(np.int32) -
+                           starts[-1])
+            values.append(flat[echo])
+        # The runs and values of all frames are packed back to back.
+        self._runoffsets = np.cumsum([0] + [len(s) for s in starts])
+        self._valoffsets = np.cumsum([0] + [len(v) for v in values])
+        self._starts = np.concatenate(starts)
+        self._lengths = np.concatenate(lengths)
+        self._values = np.concatenate(values)
+        self.dtype = self._values.dtype
+        self._local = threading.local()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not hasattr(self._local, 'buffer'):
+            self._local.buffer = np.empty(self.shape[1:], dtype=self.dtype)
+        return self.decode(index, self._local.buffer)
+
+    def nbytes(self):
+        return (self._starts.nbytes + self._lengths.nbytes +
+                self._values.nbytes)
+
+    def decode(self, index, out=None):
+        if out is None:
+            out = np.empty(self.shape[1:], dtype=self.dtype)
+        runs = slice(self._runoffsets[index], self._runoffsets[index + 1])
+        starts = self._starts[runs]
+        lengths = self._lengths[runs]
+        values = self._values[self._valoffsets[index]:
+                              self._valoffsets[index + 1]]
+        within = (np.arange(len(values)) -
+                  np.repeat(np.cumsum(lengths) - lengths, lengths))
+        out.fill(self.fill)
+        out.reshape(-1)[np.repeat(starts, lengths) + within] = values
+        return out
+
+class Quantizer(object):
+    """
+    Quantize reflectivity into uint8 codes of *step* dBZ bins. Code
+    ``k`` stands for ``k * step`` dBZ, up to code 255. Code 0 is
+    reserved for values below *threshold* (and missing values), which
+    the radar display draws in its under color. A Quantizer can be given
+    to :class:`FrameCache` as its transform, which makes cached frames
+    4 times smaller than float32 ones.
+
+    """
+    def __init__(self, threshold=0.1, step=0.5):
+        self.threshold = threshold
+        self.step = step
+
+    def __call__(self, data):
+        data = np.asarray(data, dtype=float)
+        codes = np.zeros(data.shape, dtype=np.uint8)
+        echo = data >= self.threshold
+        # Weak echoes must not round down to the no-echo code.
+        codes[echo] = np.clip(np.round(data[echo] / self.step), 1, 255)
+        return codes
+
+    def decode(self, codes):
+        """
+        Map codes back onto the dBZ values they stand for. Code 0 maps
+        to NaN, as there is no single value for it.
+        """
+        values = np.asarray(codes, dtype=float) * self.step
+        return np.where(np.asarray(codes) == 0, np.nan, values)
+
+    def lut(self, to_rgba):
+        """
+        Build the 256-entry RGBA lookup table for the codes, using
+        *to_rgba* (such as ``RadarDisplay.to_rgba``) to colormap the
+        value of each code.
+        """
+        values = self.decode(np.arange(256))
+        # Anything below the threshold gets the under color.
+        values[0] = self.threshold - 1
+        return to_rgba(values[np.newaxis, :])[0]
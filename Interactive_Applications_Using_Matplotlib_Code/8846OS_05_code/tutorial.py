@@ -1,7 +1,15 @@
 from mpl_toolkits.basemap import shapefile
+import os
+import threading
+from glob import glob
+from multiprocessing import Pool
 from collections import defaultdict
-from itertools import groupby, izip
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 
 storm_dtype = [('xcent', 'f'), ('ycent', 'f'), ('frame_index', 'i'),
                ('frame_time', 'f'), ('feat_size', 'f'),
@@ -16,12 +24,504 @@ def storm_loader(filename):
     and then a Nx2 array of polygon vertices ('poly').
 
     """
-    shp = shapefile.Reader(filename)
-    storms = np.array([tuple(record) + (np.array(poly.points),)
-                       for record, poly in
-                       izip(shp.iterRecords(), shp.iterShapes())],
-                      dtype=storm_dtype)
-    return storms
+    return columnar_storm_loader(filename).to_records()
+
+# Same as storm_dtype, minus the object column holding the polygons.
+column_dtype = [col for col in storm_dtype if col[0] != 'poly']
+
+class StormTable(object):
+    """
+    Columnar version of the table returned by :func:`storm_loader`.
+
+    The scalar columns are held in a structured array of `column_dtype`,
+    and the vertices of every polygon are packed into one contiguous
+    Mx2 float array. Polygon ``i`` is ``verts[offsets[i]:offsets[i + 1]]``,
+    so there is no Python object per stormcell.
+
+    Indexing follows the structured array it replaces: a column name
+    gives that column (``'poly'`` gives a list of per-cell vertex views),
+    an integer gives a single `storm_dtype` row, and a slice, mask or
+    index array gives a new StormTable. Iterating yields rows, so
+    :func:`storm_saver` accepts either form.
+
+    """
+    def __init__(self, columns, verts, offsets):
+        self.columns = columns
+        self.verts = verts
+        self.offsets = offsets
+
+    @classmethod
+    def from_records(cls, storms):
+        """
+        Build a StormTable from a `storm_dtype` structured array.
+        """
+        columns = np.empty(len(storms), dtype=column_dtype)
+        for name, _ in column_dtype:
+            columns[name] = storms[name]
+        polys = [np.zeros((0, 2)) if poly is None else
+                 np.asarray(poly, dtype=float).reshape(-1, 2)
+                 for poly in storms['poly']]
+        return cls.from_polygons(columns, polys)
+
+    @classmethod
+    def from_polygons(cls, columns, polys):
+        """
+        Build a StormTable from the scalar columns and a list of Nx2
+        vertex arrays, one per row of *columns*.
+        """
+        offsets = np.zeros(len(polys) + 1, dtype=np.intp)
+        np.cumsum([len(poly) for poly in polys], out=offsets[1:])
+        verts = np.empty((offsets[-1], 2), dtype=float)
+        for start, stop, poly in zip(offsets[:-1], offsets[1:], polys):
+            verts[start:stop] = poly
+        return cls(columns, verts, offsets)
+
+    @classmethod
+    def concatenate(cls, tables):
+        """
+        Join a sequence of StormTables end to end.
+        """
+        tables = list(tables)
+        if not tables:
+            return cls(np.empty(0, dtype=column_dtype), np.zeros((0, 2)),
+                       np.zeros(1, dtype=np.intp))
+        columns = np.concatenate([table.columns for table in tables])
+        verts = np.concatenate([table.verts for table in tables])
+        offsets = np.zeros(len(columns) + 1, dtype=np.intp)
+        np.cumsum(np.concatenate([table.lengths() for table in tables]),
+                  out=offsets[1:])
+        return cls(columns, verts, offsets)
+
+    def to_records(self):
+        """
+        Return the equivalent `storm_dtype` structured array. The
+        'poly' entries are views into this table's vertex buffer.
+        """
+        storms = np.empty(len(self), dtype=storm_dtype)
+        for name, _ in column_dtype:
+            storms[name] = self.columns[name]
+        # Assign one at a time so numpy doesn't try to broadcast
+        # equal-length polygons into a single block.
+        for i, poly in enumerate(self.polygons()):
+            storms['poly'][i] = poly
+        return storms
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key == 'poly':
+                return self.polygons()
+            return self.columns[key]
+        if np.ndim(key) == 0 and not isinstance(key, slice):
+            row = np.empty(1, dtype=storm_dtype)
+            for name, _ in column_dtype:
+                row[name] = self.columns[name][key]
+            row['poly'][0] = self.polygon(key)
+            return row[0]
+        if isinstance(key, slice):
+            return self.take(np.arange(len(self))[key])
+        key = np.asarray(key)
+        if key.dtype == bool:
+            key = np.flatnonzero(key)
+        return self.take(key)
+
+    def __setitem__(self, key, value):
+        if key == 'poly':
+            raise ValueError("The polygons of a StormTable can not be "
+                             "reassigned")
+        self.columns[key] = value
+
+    def lengths(self):
+        """
+        Number of vertices in each polygon.
+        """
+        return np.diff(self.offsets)
+
+    def polygon(self, index):
+        """
+        Return a view of the vertices of the stormcell at *index*.
+        """
+        if index < 0:
+            index += len(self)
+        return self.verts[self.offsets[index]:self.offsets[index + 1]]
+
+    def polygons(self):
+        """
+        Return a list of vertex views, one per stormcell.
+        """
+        return [self.verts[start:stop] for start, stop in
+                zip(self.offsets[:-1], self.offsets[1:])]
+
+    def take(self, indexes):
+        """
+        Return a new StormTable holding only the rows at *indexes*,
+        with the vertex buffer gathered in a single pass.
+        """
+        indexes = np.asarray(indexes, dtype=np.intp)
+        gather, offsets = _ragged_take(self.offsets, indexes)
+        return StormTable(self.columns[indexes], self.verts[gather], offsets)
+
+    def copy(self):
+        return StormTable(self.columns.copy(), self.verts.copy(),
+                          self.offsets.copy())
+
+    def delete(self, indexes):
+        """
+        Return a new StormTable without the rows at *indexes*, like
+        :func:`numpy.delete` does for the structured array.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[indexes] = False
+        return self.take(np.flatnonzero(keep))
+
+    def append(self, storms):
+        """
+        Return a new StormTable with *storms*, either a StormTable or
+        `storm_dtype` rows, added at the end.
+        """
+        if not isinstance(storms, StormTable):
+            storms = StormTable.from_records(np.atleast_1d(storms))
+        return StormTable.concatenate([self, storms])
+
+def _ragged_take(offsets, indexes):
+    """
+    For a ragged buffer described by *offsets*, compute the element
+    indexes that gather the runs selected by *indexes*, along with the
+    offsets of the gathered buffer.
+    """
+    starts = offsets[:-1][indexes]
+    lengths = offsets[1:][indexes] - starts
+    new_offsets = np.zeros(len(indexes) + 1, dtype=np.intp)
+    np.cumsum(lengths, out=new_offsets[1:])
+    gather = (np.arange(new_offsets[-1], dtype=np.intp) +
+              np.repeat(starts - new_offsets[:-1], lengths))
+    return gather, new_offsets
+
+def _gather(buf, positions, dtype, count=1):
+    """
+    Read *count* consecutive *dtype* values from the byte buffer *buf*
+    at each of the byte *positions*, regardless of alignment. Returns
+    an array of shape (len(positions),), or (len(positions), count)
+    when *count* is more than 1.
+
+    """
+    dtype = np.dtype(dtype)
+    width = dtype.itemsize * count
+    # One overlapping row of *width* bytes starting at every byte, so
+    # the gather needs a single index per position.
+    rows = as_strided(buf, (max(len(buf) - width + 1, 0), width), (1, 1))
+    values = rows[positions].view(dtype)
+    return values.ravel() if count == 1 else values
+
+def _read_dbf(dbfname, start=0, stop=None):
+    """
+    Parse the fixed-width records *start* to *stop* of a dBase file in
+    one pass. Returns the `column_dtype` table and a boolean mask of the
+    records that are flagged as deleted.
+    """
+    with open(dbfname, 'rb') as f:
+        header = np.fromfile(f, dtype=np.uint8, count=32)
+        nrecords = int(header[4:8].view('<u4')[0])
+        headerlen = int(header[8:10].view('<u2')[0])
+        recordlen = int(header[10:12].view('<u2')[0])
+        descriptors = np.fromfile(f, dtype=np.uint8, count=headerlen - 32)
+
+        # Field descriptors are 32 bytes each, terminated by a 0x0D byte.
+        fields = [('deleted', 'S1')]
+        for pos in range(0, len(descriptors) - 1, 32):
+            if descriptors[pos] == 0x0D:
+                break
+            fields.append(('f%d' % len(fields),
+                           'S%d' % descriptors[pos + 16]))
+        rowdtype = np.dtype(fields)
+        if rowdtype.itemsize < recordlen:
+            fields.append(('pad', 'V%d' % (recordlen - rowdtype.itemsize)))
+
+        start, stop, _ = slice(start, stop).indices(nrecords)
+        f.seek(headerlen + start * recordlen)
+        records = np.fromfile(f, dtype=np.dtype(fields),
+                              count=max(stop - start, 0))
+
+    columns = np.empty(len(records), dtype=column_dtype)
+    # The storm columns are matched positionally, as storm_loader did.
+    for (name, _), (field, _) in zip(column_dtype, fields[1:]):
+        text = np.char.strip(records[field])
+        text[text == b''] = b'nan'
+        columns[name] = text.astype(float)
+    return columns, records['deleted'] == b'*'
+
+def _shp_record_index(shpname):
+    """
+    Byte offset and content length of each record in a .shp file, taken
+    from the .shx index when there is one, or else by walking the record
+    headers.
+    """
+    shxname = shpname[:-4] + '.shx'
+    if os.path.exists(shxname):
+        with open(shxname, 'rb') as f:
+            f.seek(100)
+            # Big-endian (offset, length) pairs counted in 16-bit words.
+            shx = np.fromfile(f, dtype='>i4').astype(np.intp) * 2
+        return shx[::2], shx[1::2]
+    offsets, lengths = [], []
+    with open(shpname, 'rb') as f:
+        f.seek(100)
+        recheader = f.read(8)
+        while len(recheader) == 8:
+            offsets.append(f.tell() - 8)
+            lengths.append(2 * int(np.frombuffer(recheader, '>i4')[1]))
+            f.seek(lengths[-1], 1)
+            recheader = f.read(8)
+    return (np.array(offsets, dtype=np.intp),
+            np.array(lengths, dtype=np.intp))
+
+def _read_shp(shpname, index, start=0, stop=None):
+    """
+    Parse the polygon records *start* to *stop* of a .shp file with
+    vectorized reads, using the record *index* from _shp_record_index.
+    Returns the packed vertex buffer and its offsets, one polygon per
+    record. Multi-part polygons have their parts concatenated, and
+    null shapes get no vertices.
+    """
+    recoffsets, reclengths = index
+    recoffsets = recoffsets[start:stop]
+    reclengths = reclengths[start:stop]
+    if not len(recoffsets):
+        return np.zeros((0, 2)), np.zeros(1, dtype=np.intp)
+    lo = recoffsets.min()
+    with open(shpname, 'rb') as f:
+        f.seek(lo)
+        buf = np.fromfile(f, dtype=np.uint8,
+                          count=(recoffsets + 8 + reclengths).max() - lo)
+
+    content = recoffsets - lo + 8
+    shapetype = _gather(buf, content, '<i4')
+    # Polygon, PolygonZ and PolygonM all start with the same layout.
+    ispoly = (shapetype == 5) | (shapetype == 15) | (shapetype == 25)
+    nparts = np.zeros(len(content), dtype=np.intp)
+    npoints = np.zeros(len(content), dtype=np.intp)
+    nparts[ispoly] = _gather(buf, content[ispoly] + 36, '<i4')
+    npoints[ispoly] = _gather(buf, content[ispoly] + 40, '<i4')
+
+    offsets = np.zeros(len(content) + 1, dtype=np.intp)
+    np.cumsum(npoints, out=offsets[1:])
+    pointstart = content + 44 + 4 * nparts
+    within = (np.arange(offsets[-1], dtype=np.intp) -
+              np.repeat(offsets[:-1], npoints))
+    positions = np.repeat(pointstart, npoints) + 16 * within
+    verts = _gather(buf, positions, '<f8', 2).astype(float, copy=False)
+    return verts, offsets
+
+def _read_storm_records(base, index, start=0, stop=None):
+    columns, deleted = _read_dbf(base + '.dbf', start, stop)
+    verts, offsets = _read_shp(base + '.shp', index, start, stop)
+    table = StormTable(columns, verts, offsets)
+    if deleted.any():
+        table = table.take(np.flatnonzero(~deleted))
+    return table
+
+def columnar_storm_loader(filename):
+    """
+    Same as :func:`storm_loader`, but return a :class:`StormTable`
+    instead of a structured array with an object column.
+
+    The .dbf and .shp files are parsed in bulk with numpy rather than
+    record by record through pyshp.
+
+    """
+    base = filename[:-4] if filename.endswith('.shp') else filename
+    return _read_storm_records(base, _shp_record_index(base + '.shp'))
+
+def storm_frame_loader(filename, window=2, chunksize=4096, columnar=False):
+    """
+    Generator version of :func:`storm_loader`. Yields
+    ``(frame_index, storms)`` pairs, one per frame, while the shapefile
+    is still being read *chunksize* records at a time.
+
+    Records of up to *window* frames are held back in case more records
+    of those frames follow. Once more than *window* frames are pending,
+    the lowest one is yielded, so memory stays bounded by the window
+    rather than by the file. *window* must be at least 1, as the last
+    frame of a chunk may carry on into the next chunk. For a file that
+    is ordered by frame, as our storm files are, every frame is yielded
+    exactly once and in order. Otherwise, records arriving for an
+    already yielded frame are yielded again as a further group for
+    that frame.
+
+    If *columnar* is True, each group is a :class:`StormTable`.
+
+    """
+    if window < 1:
+        raise ValueError("window must be at least 1, not %r" % (window,))
+    base = filename[:-4] if filename.endswith('.shp') else filename
+    index = _shp_record_index(base + '.shp')
+    pending = {}
+    for start in range(0, len(index[0]), chunksize):
+        table = _read_storm_records(base, index, start, start + chunksize)
+        keys, indexes, bounds = group_indexes(table['frame_index'])
+        for frame, lo, hi in zip(keys, bounds[:-1], bounds[1:]):
+            pending.setdefault(int(frame), []).append(
+                table.take(indexes[lo:hi]))
+        while len(pending) > window:
+            frame = min(pending)
+            group = StormTable.concatenate(pending.pop(frame))
+            yield frame, group if columnar else group.to_records()
+    for frame in sorted(pending):
+        group = StormTable.concatenate(pending.pop(frame))
+        yield frame, group if columnar else group.to_records()
+
+_cache_magic = b'STRMCCH1'
+_cache_header_dtype = [('magic', 'S8'),
+                       ('shp_mtime', 'f8'), ('shp_size', 'i8'),
+                       ('dbf_mtime', 'f8'), ('dbf_size', 'i8'),
+                       ('nrows', 'i8'), ('nverts', 'i8')]
+
+def _cache_sources(filename):
+    base = filename[:-4] if filename.endswith('.shp') else filename
+    return base + '.shp', base + '.dbf', base + '.stormcache'
+
+def _cache_stamp(shpname, dbfname):
+    shp_stat = os.stat(shpname)
+    dbf_stat = os.stat(dbfname)
+    return (shp_stat.st_mtime, shp_stat.st_size,
+            dbf_stat.st_mtime, dbf_stat.st_size)
+
+def _cache_layout(nrows, nverts):
+    """
+    Byte offsets of the columns, offsets and vertex blocks in a cache
+    file, each rounded up to an 8-byte boundary.
+    """
+    align = lambda n: (n + 7) // 8 * 8
+    colstart = align(np.dtype(_cache_header_dtype).itemsize)
+    offstart = align(colstart + nrows * np.dtype(column_dtype).itemsize)
+    vertstart = align(offstart + (nrows + 1) * 8)
+    return colstart, offstart, vertstart, vertstart + nverts * 16
+
+def read_storm_cache(filename):
+    """
+    Memory-map the cache sidecar of the shapefile *filename* and
+    return it as a :class:`StormTable`, or None if there is no cache or
+    the shapefile has changed (by mtime or size) since it was written.
+    """
+    shpname, dbfname, cachename = _cache_sources(filename)
+    try:
+        stamp = _cache_stamp(shpname, dbfname)
+        header = np.fromfile(cachename, dtype=_cache_header_dtype, count=1)
+    except (IOError, OSError):
+        return None
+    if len(header) != 1 or header['magic'][0] != _cache_magic:
+        return None
+    header = header[0]
+    if (header['shp_mtime'], header['shp_size'],
+        header['dbf_mtime'], header['dbf_size']) != stamp:
+        return None
+
+    nrows, nverts = int(header['nrows']), int(header['nverts'])
+    colstart, offstart, vertstart, end = _cache_layout(nrows, nverts)
+    if os.path.getsize(cachename) != end:
+        return None
+    mm = np.memmap(cachename, dtype=np.uint8, mode='c')
+    columns = mm[colstart:colstart + nrows * np.dtype(column_dtype).itemsize]
+    offsets = mm[offstart:offstart + (nrows + 1) * 8]
+    verts = mm[vertstart:end]
+    return StormTable(columns.view(column_dtype),
+                      verts.view('f8').reshape(nverts, 2),
+                      offsets.view('i8'))
+
+def write_storm_cache(filename, table):
+    """
+    Write *table* (a :class:`StormTable`) as the cache sidecar of the
+    shapefile *filename*, stamped with the shapefile's mtime and size.
+    The file is written under a temporary name and renamed into place,
+    so a reader never maps a partial cache.
+    """
+    shpname, dbfname, cachename = _cache_sources(filename)
+    header = np.zeros(1, dtype=_cache_header_dtype)
+    header[0] = ((_cache_magic,) + _cache_stamp(shpname, dbfname) +
+                 (len(table), len(table.verts)))
+    colstart, offstart, vertstart, end = _cache_layout(len(table),
+                                                       len(table.verts))
+    tmpname = cachename + '.tmp'
+    with open(tmpname, 'wb') as f:
+        f.write(header.tobytes())
+        f.seek(colstart)
+        f.write(np.asarray(table.columns, dtype=column_dtype).tobytes())
+        f.seek(offstart)
+        f.write(np.asarray(table.offsets, dtype='i8').tobytes())
+        f.seek(vertstart)
+        f.write(np.asarray(table.verts, dtype='f8').tobytes())
+        f.truncate(end)
+    os.rename(tmpname, cachename)
+
+def cached_storm_loader(filename, columnar=False):
+    """
+    Same as :func:`storm_loader`, but go through a memory-mapped binary
+    sidecar ('polygons.stormcache' next to 'polygons.shp'). The
+    shapefile is only parsed when the cache is missing or stale, and the
+    cache is then rewritten. If *columnar* is True, return the
+    :class:`StormTable` itself, backed directly by the mapped file.
+
+    """
+    table = read_storm_cache(filename)
+    if table is None:
+        table = columnar_storm_loader(filename)
+        try:
+            write_storm_cache(filename, table)
+        except (IOError, OSError):
+            # A read-only data directory just means no caching.
+            pass
+    return table if columnar else table.to_records()
+
+def sharded_storm_loader(dirname, pattern='polygons*.shp', processes=None,
+                         columnar=False):
+    """
+    Load every shapefile in *dirname* matching *pattern*, parsing the
+    shards concurrently in a pool of *processes* worker processes (by
+    default, one per CPU), and merge them into one storm table in
+    filename order.
+
+    Shards number their frames, features and tracks independently, so
+    each shard's frame_index, feat_id and track_id values are shifted
+    past those of the shards before it. Negative track_ids (cells that
+    are not part of a track) are left alone.
+
+    """
+    filenames = sorted(glob(os.path.join(dirname, pattern)))
+    if not filenames:
+        raise ValueError("No shapefiles matching '%s' in '%s'" %
+                         (pattern, dirname))
+    pool = Pool(processes)
+    try:
+        shards = pool.map(columnar_storm_loader, filenames)
+    finally:
+        pool.close()
+        pool.join()
+
+    frame_base = 0
+    feat_base = 0
+    track_base = 0
+    for shard in shards:
+        if not len(shard):
+            continue
+        frames = shard.columns['frame_index']
+        feat_ids = shard.columns['feat_id']
+        track_ids = shard.columns['track_id']
+        next_frame = frame_base + frames.max() + 1
+        next_feat = feat_base + feat_ids.max() + 1
+        next_track = track_base + max(track_ids.max(), -1) + 1
+        frames += frame_base
+        feat_ids += feat_base
+        track_ids[track_ids >= 0] += track_base
+        frame_base, feat_base, track_base = next_frame, next_feat, next_track
+
+    storms = StormTable.concatenate(shards)
+    return storms if columnar else storms.to_records()
 
 def storm_saver(filename, storms):
     """
@@ -52,22 +552,329 @@ def storm_saver(filename, storms):
         filename = filename[:-4]
     shp.save(filename)
 
+class IncrementalStormSaver(object):
+    """
+    Save storm data by patching the previously saved shapefile in place
+    instead of rewriting it.
+
+    The saver has to be told about every edit to the storm table made
+    between saves: :meth:`delete` with the row index, before the row is
+    removed, and :meth:`append` after a row is added at the end. On
+    :meth:`save`, deleted cells are flagged in the .dbf (a single byte
+    per record) and new cells are appended to the .shp, .shx and .dbf.
+    The first save to a given filename is a full :func:`storm_saver`
+    write. Flagged records stay in the files as dead space until
+    :meth:`compact` rewrites the saved file without them, which is
+    meant for when the editor closes. Both have a ``prepare_`` form
+    that splits off the file writing so that it can be run in the
+    background by a :class:`SaveWorker`.
+
+    """
+    def __init__(self):
+        self.filename = None
+        # File record number of each row of the table, -1 if unsaved.
+        self._records = None
+        # Record numbers deleted since the last save, and the number
+        # already flagged as deleted in the saved file.
+        self._deleted = []
+        self._flagged = 0
+        self._nrecords = 0
+
+    def delete(self, index):
+        if self._records is None:
+            return
+        if self._records[index] >= 0:
+            self._deleted.append(self._records[index])
+        self._records = np.delete(self._records, index)
+
+    def append(self, count=1):
+        if self._records is None:
+            return
+        self._records = np.append(self._records, [-1] * count)
+
+    def save(self, filename, storms):
+        self.prepare_save(filename, storms)()
+
+    def prepare_save(self, filename, storms):
+        """
+        Update the bookkeeping for a save of *storms* to *filename* and
+        return a function that does the actual file writing. Jobs from
+        successive calls must be run in order, but may run on another
+        thread, as long as *storms* is not modified in the meantime.
+        If a job fails, call :meth:`invalidate`.
+        """
+        if filename.endswith('.shp'):
+            filename = filename[:-4]
+        if (filename != self.filename or self._records is None or
+                len(self._records) != len(storms)):
+            self.filename = filename
+            self._records = np.arange(len(storms))
+            self._nrecords = len(storms)
+            self._deleted = []
+            self._flagged = 0
+            return lambda: storm_saver(filename, storms)
+
+        deleted = self._deleted
+        newrows = np.flatnonzero(self._records < 0)
+        self._records[newrows] = self._nrecords + np.arange(len(newrows))
+        self._nrecords += len(newrows)
+        self._flagged += len(deleted)
+        self._deleted = []
+
+        def job():
+            dbfinfo = self._dbf_info(filename + '.dbf')
+            self._flag_deleted(filename + '.dbf', dbfinfo, deleted)
+            if len(newrows):
+                self._append_dbf(filename + '.dbf', dbfinfo,
+                                 [storms[i] for i in newrows])
+                self._append_shp(filename,
+                                 [storms[i]['poly'] for i in newrows])
+        return job
+
+    def compact(self):
+        """
+        Rewrite the last saved shapefile without the records flagged as
+        deleted. Edits that have not been saved yet stay pending.
+        """
+        self.prepare_compact()()
+
+    def prepare_compact(self):
+        """
+        Same as :meth:`compact`, but split like :meth:`prepare_save`.
+        """
+        if not self._flagged:
+            return lambda: None
+        filename = self.filename
+        # Records that survive are renumbered by their rank.
+        saved = self._records >= 0
+        live = np.sort(np.concatenate([self._records[saved],
+                                       self._deleted]))
+        self._records[saved] = np.searchsorted(live, self._records[saved])
+        self._deleted = list(np.searchsorted(live, self._deleted))
+        self._nrecords = len(live)
+        self._flagged = 0
+        return lambda: storm_saver(filename, storm_loader(filename))
+
+    def invalidate(self):
+        """
+        Forget about the saved file, so the next save is a full write.
+        """
+        self.filename = None
+        self._records = None
+        self._deleted = []
+        self._flagged = 0
+        self._nrecords = 0
+
+    @staticmethod
+    def _dbf_info(dbfname):
+        """
+        Record count, header length, record length and the (size,
+        decimal) of each field of a dBase file.
+        """
+        with open(dbfname, 'rb') as f:
+            header = np.fromfile(f, dtype=np.uint8, count=32)
+            headerlen = int(header[8:10].view('<u2')[0])
+            descriptors = np.fromfile(f, dtype=np.uint8,
+                                      count=headerlen - 32)
+        fields = [(int(descriptors[pos + 16]), int(descriptors[pos + 17]))
+                  for pos in range(0, len(descriptors) - 1, 32)
+                  if descriptors[pos] != 0x0D]
+        return (int(header[4:8].view('<u4')[0]), headerlen,
+                int(header[10:12].view('<u2')[0]), fields)
+
+    @staticmethod
+    def _flag_deleted(dbfname, dbfinfo, records):
+        _, headerlen, recordlen, _ = dbfinfo
+        with open(dbfname, 'r+b') as f:
+            for record in records:
+                f.seek(headerlen + record * recordlen)
+                f.write(b'*')
+
+    @staticmethod
+    def _append_dbf(dbfname, dbfinfo, storms):
+        nrecords, headerlen, recordlen, fields = dbfinfo
+        rows = []
+        for storm in storms:
+            row = ' '
+            for (name, _), (size, decimal) in zip(column_dtype, fields):
+                row += ('%*.*f' % (size, decimal, storm[name]))[:size]
+            rows.append(row.ljust(recordlen).encode('ascii'))
+        with open(dbfname, 'r+b') as f:
+            # Write over the end-of-file marker, and then put it back.
+            f.seek(headerlen + nrecords * recordlen)
+            f.write(b''.join(rows) + b'\x1a')
+            f.truncate()
+            f.seek(4)
+            f.write(np.array(nrecords + len(rows), dtype='<u4').tobytes())
+
+    @staticmethod
+    def _append_shp(basename, polys):
+        shx = np.fromfile(basename + '.shx', dtype=np.uint8, count=100)
+        bbox = shx[36:68].view('<f8').copy()
+        shpsize = os.path.getsize(basename + '.shp')
+        shxsize = os.path.getsize(basename + '.shx')
+        recnum = (shxsize - 100) // 8
+
+        shprecords = []
+        shxrecords = []
+        for poly in polys:
+            recnum += 1
+            if poly is not None and len(poly) > 0:
+                poly = np.asarray(poly, dtype='<f8').reshape(-1, 2)
+                lo, hi = poly.min(axis=0), poly.max(axis=0)
+                content = (np.array([5], '<i4').tobytes() +
+                           np.array([lo[0], lo[1], hi[0], hi[1]],
+                                    '<f8').tobytes() +
+                           np.array([1, len(poly), 0], '<i4').tobytes() +
+                           poly.tobytes())
+                bbox = np.concatenate([np.minimum(bbox[:2], lo),
+                                       np.maximum(bbox[2:], hi)])
+            else:
+                content = np.array([0], '<i4').tobytes()
+            shxrecords.append(np.array([shpsize // 2, len(content) // 2],
+                                       '>i4').tobytes())
+            shprecords.append(np.array([recnum, len(content) // 2],
+                                       '>i4').tobytes() + content)
+            shpsize += 8 + len(content)
+
+        with open(basename + '.shp', 'r+b') as f:
+            f.seek(0, 2)
+            f.write(b''.join(shprecords))
+            f.seek(24)
+            f.write(np.array(shpsize // 2, '>i4').tobytes())
+            f.seek(36)
+            f.write(bbox.astype('<f8').tobytes())
+        with open(basename + '.shx', 'r+b') as f:
+            f.seek(0, 2)
+            f.write(b''.join(shxrecords))
+            f.seek(24)
+            f.write(np.array((shxsize + 8 * len(polys)) // 2,
+                             '>i4').tobytes())
+            f.seek(36)
+            f.write(bbox.astype('<f8').tobytes())
+
+class SaveWorker(object):
+    """
+    Run save jobs (see :meth:`IncrementalStormSaver.prepare_save`) one
+    at a time, in order, on background threads. The outcome of each job
+    is reported back on the GUI thread by processing a 'saved' event,
+    with the job's description as the data, or a 'save_failed' event
+    with a (description, exception) tuple, through the callback
+    registry of *canvas*.
+
+    Once a job fails, the jobs queued behind it are skipped, and are
+    reported as failed too, until that failure has been reported: they
+    may build on what the failed job didn't write. Jobs submitted after
+    the report (e.g. once the saver has been invalidated) run as usual.
+
+    The threads are not daemonic, so a save that is in flight when the
+    application quits still runs to completion.
+
+    """
+    def __init__(self, canvas, interval=100):
+        self.canvas = canvas
+        self._thread = None
+        self._pending = 0
+        self._results = Queue()
+        # Jobs are tagged with the number of failures reported so far,
+        # and a job is skipped if one tagged the same has failed.
+        self._generation = 0
+        self._failed = -1
+        # Poll for finished jobs from the GUI thread.
+        self._timer = canvas.new_timer(interval=interval)
+        self._timer.add_callback(self._report)
+
+    def submit(self, description, job):
+        previous = self._thread
+        generation = self._generation
+        def run():
+            if previous is not None:
+                previous.join()
+            if self._failed >= generation:
+                err = RuntimeError("skipped after an earlier save failed")
+                self._results.put(('save_failed', (description, err)))
+                return
+            try:
+                job()
+            except Exception as err:
+                self._failed = generation
+                self._results.put(('save_failed', (description, err)))
+            else:
+                self._results.put(('saved', description))
+        self._thread = threading.Thread(target=run)
+        self._thread.start()
+        self._pending += 1
+        self._timer.start()
+
+    def busy(self):
+        return self._pending > 0
+
+    def _report(self):
+        while True:
+            try:
+                event, eventdata = self._results.get_nowait()
+            except Empty:
+                break
+            self._pending -= 1
+            if event == 'save_failed':
+                # Jobs submitted from here on are made knowing about it.
+                self._generation += 1
+            self.canvas.callbacks.process(event, eventdata)
+        if not self._pending:
+            self._timer.stop()
+
+def group_indexes(values):
+    """
+    Group the positions of *values* by value, in one pass. Returns the
+    sorted unique values (the keys), an array of row indexes ordered by
+    group and the group boundaries within it. The rows holding
+    ``keys[i]`` are ``indexes[bounds[i]:bounds[i + 1]]``, and keep their
+    original order, so the input does not need to be sorted.
+
+    """
+    values = np.asarray(values)
+    indexes = np.argsort(values, kind='mergesort')
+    keys, starts = np.unique(values[indexes], return_index=True)
+    bounds = np.append(starts, len(values))
+    return keys, indexes, bounds
+
 def track_loader(filename, group='track_id'):
+    """
+    Return a dictionary of Nx2 arrays of the storm centroids, keyed by
+    the *group* column.
+    """
     storms = storm_loader(filename)
+    keys, indexes, bounds = group_indexes(storms[group])
+    points = np.column_stack([storms['xcent'], storms['ycent']])[indexes]
     tracks = defaultdict(list)
-    for key, items in groupby(storms, lambda x: x[group]):
-        for storm in items:
-            tracks[key].append((storm['xcent'], storm['ycent']))
+    for key, start, stop in zip(keys, bounds[:-1], bounds[1:]):
+        tracks[key] = points[start:stop]
     return tracks
 
 def polygon_loader(filename, group='frame_index'):
+    """
+    Return a dictionary of lists of polygon vertex arrays, keyed by the
+    *group* column.
+    """
     storms = storm_loader(filename)
+    keys, indexes, bounds = group_indexes(storms[group])
+    polys = storms['poly'][indexes]
     polygons = defaultdict(list)
-    for key, items in groupby(storms, lambda x: x[group]):
-        for storm in items:
-            polygons[key].append(storm['poly'])
+    for key, start, stop in zip(keys, bounds[:-1], bounds[1:]):
+        polygons[key] = list(polys[start:stop])
     return polygons
 
+def lonlat_to_km(lons, lats, lat0):
+    """
+    Project lon/lat pairs in degrees onto a flat grid in km, using an
+    equirectangular projection about the latitude *lat0*. Distances
+    are close to the true ones near *lat0*. Returns an array with the
+    x and y values along its last axis.
+    """
+    kmperdeg = np.deg2rad(6371.0)
+    return np.stack([np.asarray(lons) * kmperdeg * np.cos(np.deg2rad(lat0)),
+                     np.asarray(lats) * kmperdeg], axis=-1)
+
 def calc_area(verts):
     """
     Calculate an approximate area in square km of a polygon with
@@ -75,15 +882,61 @@ def calc_area(verts):
     Must have at least 3 vertices to make a polygon.
 
     """
-    N = len(verts)
+    verts = np.asarray(verts, dtype=float).reshape(-1, 2)
+    return calc_areas(verts, [0, len(verts)])[0]
+
+def calc_areas(verts, offsets):
+    """
+    Same as :func:`calc_area`, but for many polygons at once. *verts*
+    is an Mx2 array holding the vertices of every polygon back to back,
+    and polygon ``i`` is ``verts[offsets[i]:offsets[i + 1]]`` (the
+    layout of a :class:`StormTable`). All the areas are computed in one
+    vectorized pass over the vertices.
+
+    """
+    offsets = np.asarray(offsets, dtype=np.intp)
+    lengths = np.diff(offsets)
     verts = np.deg2rad(verts)
-    if N < 3 :
-        return 0.0
+
+    # Every vertex but the last one of each polygon contributes
+    # (lon[i + 1] - lon[i - 1]) * sin(lat[i]), where the first vertex
+    # wraps around to the second to last one.
+    polyid = np.repeat(np.arange(len(lengths)), lengths)
+    within = np.arange(len(polyid)) - offsets[:-1][polyid]
+    cur = np.flatnonzero((within < lengths[polyid] - 1) &
+                         (lengths[polyid] >= 3))
+    prev = cur - 1
+    first = within[cur] == 0
+    prev[first] = cur[first] + lengths[polyid[cur[first]]] - 2
+    terms = (verts[cur + 1, 0] - verts[prev, 0]) * np.sin(verts[cur, 1])
 
     RadSq = 6371.0**2
-    area = 0.0
-    area -= ((verts[1, 0] - verts[-2, 0]) * np.sin(verts[0, 1]))
-    for i in xrange(1, N - 1):
-        area -= ((verts[i + 1, 0] - verts[i - 1, 0]) * np.sin(verts[i, 1]))
-    return 0.5 * RadSq * area
+    return -0.5 * RadSq * np.bincount(polyid[cur], weights=terms,
+                                      minlength=len(lengths))
+
+def storm_areas(storms, frame_index=None):
+    """
+    Return the area in square km of every stormcell in *storms* (a
+    :class:`StormTable` or a `storm_dtype` array), or only of those in
+    the frame *frame_index*. Unlike :func:`calc_areas`, these are
+    magnitudes, whichever way the outlines wind.
+
+    """
+    if frame_index is not None:
+        storms = storms[storms['frame_index'] == frame_index]
+    if not isinstance(storms, StormTable):
+        storms = StormTable.from_records(storms)
+    return np.abs(calc_areas(storms.verts, storms.offsets))
+
+def update_feat_size(storms, frame_index=None):
+    """
+    Recompute the 'feat_size' column of *storms* in place from the
+    polygons, for every stormcell or only those in *frame_index*.
+
+    """
+    if frame_index is None:
+        storms['feat_size'] = storm_areas(storms)
+    else:
+        rows = storms['frame_index'] == frame_index
+        storms['feat_size'][rows] = storm_areas(storms, frame_index)
 